@@ -0,0 +1,349 @@
+import contextvars
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import make_cache
+from instrumentation import StageTimer, log_event, log_payload, record_usage
+from jobs import JOB_WORKERS
+from knowledge_index import get_index, search_knowledge
+from linkedin_scraper import (
+    cached_profile, extract_username, invalidate_profile, is_profile_cached, scrape_linkedin_profile,
+)
+from openai_pool import OPENAI_RUN_TOKEN_ESTIMATE, key_fingerprint
+from profile_picture import prepare_profile_picture
+from profile_sections import (
+    OVERALL_KEY, format_sections, merge_report, profile_sections, section_headings, split_report,
+)
+from rate_limit import acting_as, get_governor
+from run_waiter import create_and_wait, message_text_delta
+from thread_sync import ThreadSync
+from tool_dispatch import dispatch_tool_calls
+
+# Instructions for analysis
+ANALYSIS_INSTRUCTIONS = """
+                                Provide an analysis/report of my LinkedIn profile below. Approach this task with professionalism and friendliness, ensure your recommendations is are both helpful and actionable. Provide detailed feedback for improvement. You can follow this structure:
+
+                                1. **Profile Picture**: Begin with the profile picture. Assess its alignment. Suggest specific changes to enhance the first impression it makes, if needed.
+                                2. **Headline and Summary**: Evaluate the clarity and impact of the headline and summary. How well do they communicate the individual's professional narrative and unique value proposition? Provide actionable advice to refine these elements, enhancing their appeal and coherence.
+                                3. **Work Experience and Skills**: Delve into the work experience and skills sections. Identify the strengths and pinpoint areas that can benefit from greater detail or stronger examples of achievements. Recommend strategies to showcase expertise/skills more effectively.
+                                4. **Educational Background and Volunteer Experience**: Analyze the education section and provide recommendations, if needed. Do the same for the Volunteer experience, if present. Advise on optimizing these areas to support the professional identity and narrative.
+                                Each section should receive an assessment that contributes to an overall profile rating. Conclude with:
+                                5. **Overall Quality Evaluation and Potential**: Rate the profile's current state out of 100, based on the coherence, presentation, and effectiveness of all sections combined - be as objective as you can, refrain from giving overly high ratings, unless the profile really is amazing, you can be critical, but still friendly. Then, estimate the potential score increase achievable by implementing your recommendations. Highlight the transformative impact of suggested changes, not just incrementally but in terms of elevating the profile's professional stature and networking potential.
+
+                                Remember, your analysis should be comprehensive and nuanced, leveraging your expertise and any relevant external information from the files, where relevant. Address me directly and use the first person for a personal touch Let's evaluate this LinkedIn profile:
+                            """
+
+# Instructions for re-analyzing only the sections that changed since the last analysis
+DELTA_INSTRUCTIONS = """I updated parts of my LinkedIn profile since your last review. Review only the updated sections below with the same professionalism and friendliness, giving detailed, actionable feedback for each. Then update the overall evaluation: rate the whole profile out of 100, taking your previous evaluation of the unchanged sections into account, and estimate the potential score increase of your recommendations. Address me directly and use the first person."""
+
+# Result of preparing an analysis: the thread to run on, the scraped profile, the stage timer and the
+# differential analysis plan (None when differential analysis is off)
+AnalysisSetup = namedtuple("AnalysisSetup", ["thread_id", "formatted_text", "image_url", "analysis_request", "timer", "plan"])
+
+# How much of a profile must be (re-)analyzed: "full" (no usable earlier analysis), "delta" (only the
+# `changed` sections) or "cached" (nothing changed). `previous` is the stored analysis, if any.
+AnalysisPlan = namedtuple("AnalysisPlan", ["mode", "store_key", "sections", "changed", "removed", "previous"])
+
+# Per-section assessments of the last analysis of each profile, so re-analyses only send what changed
+DIFFERENTIAL_ANALYSIS = os.getenv('DIFFERENTIAL_ANALYSIS', '1').lower() in ("1", "true", "yes")
+analysis_store = make_cache(
+    "analyses",
+    backend=os.getenv('ANALYSIS_CACHE_BACKEND'),
+    path=os.getenv('ANALYSIS_CACHE_PATH'),
+    ttl=int(os.getenv('ANALYSIS_CACHE_TTL', 30 * 24 * 3600)),
+    max_entries=int(os.getenv('ANALYSIS_CACHE_SIZE', 1024)),
+)
+
+# Number of knowledge base passages added to each analysis request (0 disables retrieval)
+KNOWLEDGE_TOP_K = int(os.getenv('KNOWLEDGE_TOP_K', 4))
+
+# Run instructions for the initial analysis and for follow-up questions
+RUN_INSTRUCTIONS = "Address me directly and use first person for a personal touch. Be helpful and approachable."
+FOLLOW_UP_INSTRUCTIONS = "Be helpful and approachable."
+
+# Each running job has up to three steps on the pool at once (thread creation, the scrape, and the picture
+# prefetch or index load), so size it for every job worker; scrapes waiting on the RapidAPI governor must not
+# hold up other jobs' thread creation
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PREPARE_WORKERS', 3 * JOB_WORKERS)),
+                               thread_name_prefix="analysis")
+
+
+def _submit(func):
+    """Run func on the pool in a copy of the caller's context, so upstream calls keep its rate-limit user."""
+    return _executor.submit(contextvars.copy_context().run, func)
+
+
+def build_analysis_request(formatted_text, image_url, job_preferences="", passages=(), headings=()):
+    # Prepare the analysis request content
+    analysis_request = f"{ANALYSIS_INSTRUCTIONS}\n\n**HERE IS THE CONTENT FOR ANALYSIS**:\n- **Profile Text**: {formatted_text}\n"
+    if image_url:  # Conditionally include image URL if available
+        analysis_request += f"- **Profile Image URL**: {image_url}"
+    return analysis_request + _request_context(job_preferences, passages, headings)
+
+
+def build_delta_request(plan, image_url, job_preferences="", passages=()):
+    """Re-analysis request carrying only the changed sections, plus the previous overall evaluation for context."""
+    analysis_request = f"{DELTA_INSTRUCTIONS}\n\n**UPDATED SECTIONS**:\n{format_sections(plan.changed)}\n"
+    if image_url and any(section.key == "picture" for section in plan.changed):
+        analysis_request += f"- **Profile Image URL**: {image_url}\n"
+    unchanged = [section.title for section in plan.sections if section not in plan.changed]
+    if unchanged:
+        analysis_request += f"\n**UNCHANGED SECTIONS** (already reviewed, don't repeat them): {', '.join(unchanged)}\n"
+    if plan.removed:
+        analysis_request += f"\n**REMOVED SECTIONS**: {', '.join(plan.removed)}\n"
+    previous_overall = plan.previous["assessments"].get(OVERALL_KEY)
+    if previous_overall:
+        analysis_request += f"\n**YOUR PREVIOUS OVERALL EVALUATION**:\n{previous_overall}\n"
+    return analysis_request + _request_context(job_preferences, passages, section_headings(plan.changed))
+
+
+def _request_context(job_preferences, passages, headings):
+    text = ""
+    # Add job preferences to the analysis request if any
+    if job_preferences:
+        text += f"\n\n**ADDITIONAL** - If relevant, please incorporate the following context about the job preferences of the user to tailor the recommendations: {job_preferences}"
+
+    # Add the knowledge base passages that best match this profile
+    if passages:
+        text += "\n\n**RELEVANT GUIDANCE FROM THE KNOWLEDGE BASE**:\n"
+        text += "\n".join(f"- ({passage.source}) {passage.text}" for passage in passages)
+
+    # Fixed headings let the report be split into per-section assessments for later re-analyses
+    if headings:
+        text += "\n\n**REPORT FORMAT** - Write one part per line below, using the line verbatim as a level-3 markdown heading (`### ...`), in this order:\n"
+        text += "\n".join(f"### {heading}" for heading in headings)
+    return text
+
+
+def analysis_store_key(assistant_id, profile_url, job_preferences=""):
+    preferences = hashlib.sha256(job_preferences.strip().encode()).hexdigest()[:16]
+    return f"{assistant_id}|{extract_username(profile_url)}|{preferences}"
+
+
+def plan_analysis(assistant_id, profile_url, image_url, job_preferences=""):
+    """Compare the scraped profile with its last stored analysis, section by section. Returns an AnalysisPlan or None."""
+    profile = cached_profile(profile_url)
+    if not DIFFERENTIAL_ANALYSIS or not assistant_id or profile is None:
+        return None
+    store_key = analysis_store_key(assistant_id, profile_url, job_preferences)
+    sections = profile_sections(profile, image_url)
+
+    entry = analysis_store.get(store_key)
+    if entry is None:
+        return AnalysisPlan("full", store_key, sections, sections, [], None)
+    previous = entry.value
+    changed = [section for section in sections if previous["digests"].get(section.key) != section.digest]
+    current_keys = {section.key for section in sections}
+    removed = [title for key, title in previous["titles"].items() if key not in current_keys]
+    mode = "delta" if changed or removed else "cached"
+    return AnalysisPlan(mode, store_key, sections, changed, removed, previous)
+
+
+def store_analysis(plan, report):
+    """
+    Save the per-section assessments of a finished run and return the full report: the run's report for a
+    full analysis, or the stored assessments merged with the new ones for a delta. If the report doesn't
+    follow the requested headings, it is returned as is and nothing is stored.
+    """
+    intro, assessments = split_report(report, plan.sections)
+    if not assessments:
+        return report
+    previous = plan.previous or {"intro": "", "digests": {}, "titles": {}, "assessments": {}}
+    # Changed sections only get what this run wrote about them; their old feedback is out of date
+    changed = {section.key for section in plan.changed}
+    merged = {section.key: (assessments if section.key in changed else previous["assessments"]).get(section.key)
+              for section in plan.sections}
+    merged[OVERALL_KEY] = assessments.get(OVERALL_KEY) or previous["assessments"].get(OVERALL_KEY)
+    intro = intro if plan.mode == "full" else previous["intro"]
+    analysis_store.set(plan.store_key, {
+        "intro": intro,
+        # Sections the run didn't assess keep no digest, so the next re-analysis sends them again
+        "digests": {section.key: section.digest for section in plan.sections if merged.get(section.key)},
+        "titles": {section.key: section.title for section in plan.sections},
+        "assessments": {key: text for key, text in merged.items() if text},
+    })
+    return merge_report(intro, plan.sections, merged)
+
+
+def admit_analysis(client, profile_url=None, refresh_profile=False):
+    """
+    Admission control for new analyses and follow-ups: raise OverloadedError right away if the OpenAI quota of
+    the client's key, or RapidAPI's when the profile has to be fetched, is too backed up to start soon.
+    """
+    if profile_url and (refresh_profile or not is_profile_cached(profile_url)):
+        get_governor("rapidapi").admit()
+    get_governor(f"openai:{key_fingerprint(client.api_key)}").admit(tokens=OPENAI_RUN_TOKEN_ESTIMATE)
+
+
+def prepare_analysis(client, profile_url, job_preferences="", timer=None, scrape=scrape_linkedin_profile,
+                     assistant_id=None, refresh_profile=False):
+    """
+    Create the thread, scrape the profile and post the analysis request, overlapping the independent steps:
+    thread creation runs alongside the scrape, and the profile picture is prefetched in the background
+    (warming the picture cache for the vision tool) while the request is posted. The most relevant
+    knowledge base passages are added to the request.
+
+    With an `assistant_id`, the profile is compared with its last analysis by that assistant section by
+    section (see plan_analysis): only changed sections are sent, and if nothing changed the stored report is
+    posted as context instead of a request, so follow-up questions still work. The profile comes from the
+    profile cache unless `refresh_profile` is set, e.g. because the user has just edited it.
+
+    `scrape` can wrap scrape_linkedin_profile, e.g. to add rate limiting or retries.
+    Returns an AnalysisSetup; `formatted_text` is None when the profile could not be scraped.
+    """
+    timer = timer or StageTimer()
+    if refresh_profile:
+        invalidate_profile(profile_url)
+    if KNOWLEDGE_TOP_K:
+        # Load (or on first use build) the knowledge index while the profile is being fetched
+        _executor.submit(get_index)
+    thread_future = _submit(timer.timed("create_thread", client.beta.threads.create))
+    scrape_future = _submit(timer.timed("scrape", scrape, profile_url))
+
+    formatted_text, image_url = scrape_future.result()
+    if image_url:
+        _submit(timer.timed("prefetch_picture", prepare_profile_picture, image_url))
+    thread = thread_future.result()
+
+    if not formatted_text:
+        return AnalysisSetup(thread.id, None, None, None, timer, None)
+
+    with timer.stage("plan"):
+        plan = plan_analysis(assistant_id, profile_url, image_url, job_preferences)
+
+    if plan and plan.mode == "cached":
+        analysis_request = (
+            f"For reference, here is my LinkedIn profile:\n{formatted_text}\n\n"
+            f"And here is the review you gave me:\n{cached_report(plan)}"
+        )
+    else:
+        passages = []
+        if KNOWLEDGE_TOP_K:
+            query = format_sections(plan.changed) if plan and plan.mode == "delta" else formatted_text
+            with timer.stage("retrieve"):
+                passages = search_knowledge(f"{query}\n{job_preferences}", KNOWLEDGE_TOP_K)
+        if plan and plan.mode == "delta":
+            analysis_request = build_delta_request(plan, image_url, job_preferences, passages)
+        else:
+            headings = section_headings(plan.sections) if plan else ()
+            analysis_request = build_analysis_request(formatted_text, image_url, job_preferences, passages, headings)
+    log_payload("Analysis request", analysis_request)
+    with timer.stage("post_message"):
+        client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=analysis_request
+        )
+    return AnalysisSetup(thread.id, formatted_text, image_url, analysis_request, timer, plan)
+
+
+def cached_report(plan):
+    previous = plan.previous
+    return merge_report(previous["intro"], plan.sections, previous["assessments"])
+
+
+def run_analysis(client, assistant_id, profile_url, job_preferences="", timer=None, scrape=scrape_linkedin_profile,
+                 on_event=None, wait=create_and_wait, refresh_profile=False):
+    """
+    Run a complete analysis without any UI: scrape, post the request, wait for the run and collect the reply.
+    Returns a dict with the report text (None if the profile could not be scraped) and the stage timings.
+    Run stream events are passed to `on_event`. Run failures raise RunFailedError / RunTimeoutError.
+    `wait` starts the run and waits for it, with create_and_wait's signature (e.g. to retry just the run).
+    `refresh_profile` fetches the profile again instead of using the cached one.
+    """
+    timer = timer or StageTimer()
+    setup = prepare_analysis(client, profile_url, job_preferences, timer=timer, scrape=scrape, assistant_id=assistant_id,
+                             refresh_profile=refresh_profile)
+    if not setup.formatted_text:
+        return {"thread_id": setup.thread_id, "report": None, "timings": timer.as_dict()}
+    plan = setup.plan
+    if plan and plan.mode == "cached":
+        # Nothing changed since the last analysis: no run needed
+        result = {"thread_id": setup.thread_id, "run_id": None, "report": cached_report(plan), "usage": None,
+                  "mode": "cached", "changed_sections": 0, "timings": timer.as_dict()}
+        log_event("analysis_completed", mode="cached", timings=result["timings"])
+        return result
+
+    with timer.stage("run"):
+        run = wait(
+            client,
+            setup.thread_id,
+            assistant_id,
+            instructions=RUN_INSTRUCTIONS,
+            on_requires_action=lambda run: dispatch_tool_calls(client, run, {"job_preferences": job_preferences}),
+            stream=True,
+            on_event=on_event,
+        )
+    with timer.stage("fetch_messages"):
+        replies = ThreadSync(client).run_messages(setup.thread_id, run.id)
+    report = "\n\n".join(replies)
+    if plan:
+        report = store_analysis(plan, report)
+        if plan.mode == "delta":
+            # The thread only saw the changes; give follow-up questions the whole merged review
+            with timer.stage("post_context"):
+                client.beta.threads.messages.create(
+                    thread_id=setup.thread_id,
+                    role="user",
+                    content=f"For reference, here is your complete updated review:\n{report}",
+                )
+    usage = getattr(run, "usage", None)
+    record_usage("analysis", usage)
+    result = {
+        "thread_id": setup.thread_id,
+        "run_id": run.id,
+        "report": report,
+        "usage": usage.model_dump() if usage else None,
+        "mode": plan.mode if plan else "full",
+        "changed_sections": len(plan.changed) if plan else None,
+        "timings": timer.as_dict(),
+    }
+    log_event("analysis_completed", run_id=run.id, mode=result["mode"], changed_sections=result["changed_sections"],
+              usage=result["usage"], timings=result["timings"])
+    return result
+
+
+def answer_follow_up(client, assistant_id, thread_id, user_input, job_preferences="", on_event=None, thread_sync=None):
+    """Post a follow-up question to an analysis thread and return the assistant's answer."""
+    timer = StageTimer()
+    with timer.stage("post_message"):
+        client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=user_input
+        )
+    with timer.stage("run"):
+        run = create_and_wait(
+            client,
+            thread_id,
+            assistant_id,
+            instructions=FOLLOW_UP_INSTRUCTIONS,
+            on_requires_action=lambda run: dispatch_tool_calls(client, run, {"job_preferences": job_preferences}),
+            stream=True,
+            on_event=on_event,
+        )
+    with timer.stage("fetch_messages"):
+        replies = (thread_sync or ThreadSync(client)).run_messages(thread_id, run.id)
+    usage = getattr(run, "usage", None)
+    record_usage("follow_up", usage)
+    log_event("follow_up_completed", run_id=run.id, usage=usage.model_dump() if usage else None,
+              timings=timer.as_dict())
+    return {"thread_id": thread_id, "run_id": run.id, "report": "\n\n".join(replies)}
+
+
+# Background job entry points (see jobs.py): streamed text is published as the job's progress
+
+def analysis_job(job, client, assistant_id, profile_url, job_preferences="", refresh_profile=False, user=None):
+    with acting_as(user):
+        return run_analysis(client, assistant_id, profile_url, job_preferences,
+                            on_event=lambda event: job.append_progress(message_text_delta(event)),
+                            refresh_profile=refresh_profile)
+
+
+def follow_up_job(job, client, assistant_id, thread_id, user_input, job_preferences="", thread_sync=None, user=None):
+    with acting_as(user):
+        return answer_follow_up(client, assistant_id, thread_id, user_input, job_preferences,
+                                on_event=lambda event: job.append_progress(message_text_delta(event)),
+                                thread_sync=thread_sync)
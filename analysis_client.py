@@ -0,0 +1,126 @@
+"""
+How the Streamlit app starts analyses and follow-ups: in-process on the local job queue, or through the
+analysis service (service.py) when ANALYSIS_SERVICE_URL is set. Both clients return jobs.Job objects.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import http_client
+from analysis import admit_analysis, analysis_job, follow_up_job
+from jobs import Job, get_job_queue
+from linkedin_scraper import extract_username
+from openai_pool import get_openai_client, key_fingerprint
+from rate_limit import OverloadedError
+from thread_sync import ThreadSync
+
+# Base URL of the analysis service, e.g. http://127.0.0.1:8000; unset runs everything in-process
+ANALYSIS_SERVICE_URL = os.getenv('ANALYSIS_SERVICE_URL')
+# Threads whose messages are kept synced locally for follow-ups (see thread_sync.py)
+THREAD_SYNC_CACHE_SIZE = int(os.getenv('THREAD_SYNC_CACHE_SIZE', 1024))
+
+
+class LocalAnalysisClient:
+    """Runs analyses and follow-ups as jobs on this process's job queue (jobs.py)."""
+
+    def __init__(self, queue=None, thread_sync_cache_size=THREAD_SYNC_CACHE_SIZE):
+        self.queue = queue or get_job_queue()
+        self.thread_sync_cache_size = thread_sync_cache_size
+        self._thread_syncs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_analysis(self, api_key, assistant_id, profile_url, job_preferences="", user=None,
+                       refresh_profile=False):
+        """
+        Start analyzing a profile and return the job. Raises OverloadedError if the quotas can't serve it
+        soon. The same profile and preferences submitted again (e.g. a double click) join the running job.
+        `refresh_profile` fetches the profile again instead of using the cached one (e.g. after editing it).
+        """
+        client = get_openai_client(api_key)
+        # Shed load up front rather than queueing work the API quotas can't serve soon
+        admit_analysis(client, profile_url, refresh_profile)
+        return self.queue.submit(
+            ("analysis", key_fingerprint(client.api_key), assistant_id, extract_username(profile_url),
+             job_preferences.strip(), refresh_profile),
+            analysis_job, client, assistant_id, profile_url, job_preferences, refresh_profile, user=user,
+        )
+
+    def ask_follow_up(self, api_key, assistant_id, thread_id, turn, question, job_preferences="", user=None):
+        """Answer a follow-up question on an analysis thread. `turn` tells repeated questions apart."""
+        client = get_openai_client(api_key)
+        admit_analysis(client)
+        return self.queue.submit(
+            ("follow_up", thread_id, turn, question),
+            follow_up_job, client, assistant_id, thread_id, question, job_preferences,
+            self._thread_sync(client, thread_id), user=user,
+        )
+
+    def get_job(self, job_id):
+        """The job with this ID, or None if it is unknown or has expired."""
+        return self.queue.get(job_id)
+
+    def _thread_sync(self, client, thread_id):
+        # One ThreadSync per thread, least recently used ones dropped, so each turn only fetches new messages
+        with self._lock:
+            thread_sync = self._thread_syncs.get(thread_id)
+            if thread_sync is None:
+                thread_sync = self._thread_syncs[thread_id] = ThreadSync(client)
+            self._thread_syncs.move_to_end(thread_id)
+            while len(self._thread_syncs) > self.thread_sync_cache_size:
+                self._thread_syncs.popitem(last=False)
+            return thread_sync
+
+
+class RemoteAnalysisClient:
+    """Same interface as LocalAnalysisClient, backed by the analysis service's HTTP API."""
+
+    def __init__(self, base_url=ANALYSIS_SERVICE_URL):
+        self.base_url = base_url.rstrip("/")
+
+    def start_analysis(self, api_key, assistant_id, profile_url, job_preferences="", user=None,
+                       refresh_profile=False):
+        return self._submit("/analyses", api_key, {
+            "assistant_id": assistant_id,
+            "profile_url": profile_url,
+            "job_preferences": job_preferences,
+            "refresh_profile": refresh_profile,
+            "user": user,
+        })
+
+    def ask_follow_up(self, api_key, assistant_id, thread_id, turn, question, job_preferences="", user=None):
+        return self._submit(f"/threads/{thread_id}/follow-ups", api_key, {
+            "assistant_id": assistant_id,
+            "turn": turn,
+            "question": question,
+            "job_preferences": job_preferences,
+            "user": user,
+        })
+
+    def get_job(self, job_id):
+        response = http_client.request("GET", f"{self.base_url}/jobs/{job_id}", max_retries=1)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return Job.from_dict(response.json())
+
+    def _submit(self, path, api_key, body):
+        # No retries: a 503 means the service is shedding load, which the user should see right away
+        response = http_client.request("POST", f"{self.base_url}{path}", max_retries=0, json=body,
+                                       headers={"Authorization": f"Bearer {api_key}"})
+        if response.status_code == 503:
+            raise OverloadedError("The analysis service", http_client.retry_after_seconds(response) or 1.0)
+        response.raise_for_status()
+        return Job.from_dict(response.json())
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_analysis_client():
+    """Return the process-wide analysis client: remote if ANALYSIS_SERVICE_URL is set, otherwise local."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RemoteAnalysisClient() if ANALYSIS_SERVICE_URL else LocalAnalysisClient()
+        return _client
@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+import openai
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+from analysis import run_analysis
+from linkedin_scraper import ProfileFetchError, extract_username, scrape_linkedin_profile
+from openai_pool import get_openai_client, key_fingerprint
+from rate_limit import OverloadedError, get_governor
+from run_waiter import RunFailedError, RunTimeoutError, create_and_wait, wait_for_run
+
+load_dotenv()
+
+
+# Errors worth waiting out and trying the run again; anything else would fail again the same way
+TRANSIENT_RUN_ERRORS = (
+    RunTimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+)
+# Run statuses in which a run may still complete
+ACTIVE_RUN_STATUSES = {"queued", "in_progress", "requires_action"}
+
+
+class ProfileUnavailableError(Exception):
+    """Raised when a profile could not be scraped."""
+
+
+def read_profile_urls(path):
+    """Read profile URLs from a text file, one per line. Blank lines and # comments are skipped."""
+    with open(path) as f:
+        urls = [line.strip() for line in f]
+    return [url for url in urls if url and not url.startswith("#")]
+
+
+def read_completed(output_path):
+    """Return the profile URLs that already have a successful result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line behind
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["profile_url"])
+    return completed
+
+
+class BatchAnalyzer:
+    """
+    Analyzes many profiles concurrently and retries failures. RapidAPI and OpenAI are rate limited by
+    their governors (rate_limit.py), set to the given budgets; a batch waits for quota instead of being shed.
+
+    Scrapes are retried on their own, and an analysis only retries its run on the same thread, so a
+    retry never pays for another thread and request.
+    """
+
+    def __init__(self, client, assistant_id, output_path, concurrency=4, rapidapi_rpm=30, openai_rpm=None,
+                 retries=3, job_preferences=""):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.job_preferences = job_preferences
+        get_governor("rapidapi").configure(rpm=rapidapi_rpm, max_wait=math.inf)
+        get_governor(f"openai:{key_fingerprint(client.api_key)}").configure(rpm=openai_rpm, max_wait=math.inf)
+        self._write_lock = threading.Lock()
+        self._retry_scrape = retry(
+            # A missing or private profile stays missing, so only a busy or failing RapidAPI is retried
+            retry=retry_if_exception_type((OverloadedError, ProfileFetchError)),
+            stop=stop_after_attempt(retries),
+            wait=wait_exponential(multiplier=2, min=2, max=60),
+            reraise=True,
+        )
+        self._retry_run = retry(
+            retry=retry_if_exception_type(TRANSIENT_RUN_ERRORS),
+            stop=stop_after_attempt(retries),
+            wait=wait_exponential(multiplier=2, min=2, max=60),
+            reraise=True,
+        )
+
+    def scrape(self, profile_url):
+        formatted_text, profile_image_url = scrape_linkedin_profile(profile_url)
+        if not formatted_text:
+            raise ProfileUnavailableError(f"Could not scrape {profile_url}")
+        return formatted_text, profile_image_url
+
+    def analyze(self, profile_url):
+        # Scrape first (and retry it on its own) so OpenAI is only paid for profiles we actually have. The
+        # scrape populated the profile cache, so the analysis doesn't hit RapidAPI again.
+        self._retry_scrape(self.scrape)(profile_url)
+        return run_analysis(self.client, self.assistant_id, profile_url, self.job_preferences, wait=self.wait)
+
+    def wait(self, client, thread_id, assistant_id, on_requires_action=None, timeout=300, **kwargs):
+        """create_and_wait, retried on transient errors. A retry resumes the thread's run if it is still active."""
+        attempts = 0
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1:
+                run = _latest_run(client, thread_id)
+                if run is not None and run.status in ACTIVE_RUN_STATUSES:
+                    logging.info(f"Resuming run {run.id} on thread {thread_id}")
+                    return wait_for_run(client, thread_id, run, on_requires_action, timeout=timeout)
+                if run is not None and run.status == "cancelling":
+                    # A timed-out run; the thread takes no new run until it is cancelled
+                    try:
+                        wait_for_run(client, thread_id, run, timeout=timeout)
+                    except RunFailedError:
+                        pass
+            return create_and_wait(client, thread_id, assistant_id, on_requires_action=on_requires_action,
+                                   timeout=timeout, **kwargs)
+
+        return self._retry_run(attempt)()
+
+    def write_result(self, record):
+        with self._write_lock:
+            with open(self.output_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+
+    def run(self, profile_urls):
+        """Analyze every URL that has no successful result yet. Returns (succeeded, failed) counts."""
+        completed = read_completed(self.output_path)
+        pending = list(dict.fromkeys(url for url in profile_urls if url not in completed))
+        logging.info(f"{len(completed)} profiles already done, {len(pending)} to analyze")
+
+        succeeded = failed = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self.analyze, url): url for url in pending}
+            for future in as_completed(futures):
+                url = futures[future]
+                record = {"profile_url": url, "username": extract_username(url), "finished_at": time.time()}
+                try:
+                    result = future.result()
+                    if not result["report"]:
+                        raise ProfileUnavailableError(f"Could not scrape {url}")
+                    record.update(status="ok", **result)
+                    succeeded += 1
+                except Exception as e:
+                    logging.error(f"Analysis failed for {url}: {e}")
+                    record.update(status="error", error=str(e))
+                    failed += 1
+                self.write_result(record)
+        return succeeded, failed
+
+
+def _latest_run(client, thread_id):
+    runs = client.beta.threads.runs.list(thread_id=thread_id, limit=1, order="desc")
+    return runs.data[0] if runs.data else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a file of LinkedIn profile URLs and write JSONL results.")
+    parser.add_argument("input", help="Text file with one LinkedIn profile URL per line.")
+    parser.add_argument("output", help="JSONL results file. Profiles that already succeeded in it are skipped.")
+    parser.add_argument("--assistant-id", default=os.getenv("ASSISTANT_ID"), help="Defaults to $ASSISTANT_ID.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Profiles analyzed at the same time.")
+    parser.add_argument("--rapidapi-rpm", type=float, default=30, help="RapidAPI requests per minute.")
+    parser.add_argument("--openai-rpm", type=float, default=None,
+                        help="OpenAI API requests per minute (default: the limits the API reports for the key).")
+    parser.add_argument("--retries", type=int, default=3, help="Attempts per upstream call.")
+    parser.add_argument("--job-preferences", default="", help="Job preferences context for every profile.")
+    args = parser.parse_args()
+
+    if not args.assistant_id:
+        parser.error("No assistant ID given. Pass --assistant-id or set ASSISTANT_ID.")
+
+    client = get_openai_client()
+    analyzer = BatchAnalyzer(
+        client,
+        args.assistant_id,
+        args.output,
+        concurrency=args.concurrency,
+        rapidapi_rpm=args.rapidapi_rpm,
+        openai_rpm=args.openai_rpm,
+        retries=args.retries,
+        job_preferences=args.job_preferences,
+    )
+    succeeded, failed = analyzer.run(read_profile_urls(args.input))
+    logging.info(f"Done: {succeeded} succeeded, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
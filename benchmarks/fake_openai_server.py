@@ -0,0 +1,480 @@
+"""
+A local stand-in for the parts of the OpenAI API this app uses (Assistants threads/messages/runs and chat
+completions), with configurable latency and per-endpoint request counters.
+
+Point an OpenAI client at it with `OpenAI(api_key="test", base_url=server.base_url)`.
+
+    python -m benchmarks.fake_openai_server --compare
+
+starts a server and compares the legacy fixed one-second polling loop with `run_waiter`.
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+class FakeOpenAIServer:
+    """
+    Simulated API state. Runs stay "in_progress" for `run_latency` seconds. If `tool_calls` is set and the
+    last user message contains an image URL, a run first asks for that many analyze_profile_picture calls
+    and then needs another `run_latency` seconds after the outputs are submitted.
+    """
+
+    def __init__(self, run_latency=2.0, chat_latency=0.5, tool_calls=0, reply="Here is your profile review.",
+                 stream_chunk_delay=0.01, host="127.0.0.1", port=0):
+        self.run_latency = run_latency
+        self.chat_latency = chat_latency
+        self.tool_calls = tool_calls
+        self.reply = reply
+        self.stream_chunk_delay = stream_chunk_delay
+        self.requests = Counter()
+        self.threads = {}
+        self.runs = {}
+        self.assistants = {}
+        self.files = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    # Threads and messages
+
+    def create_thread(self):
+        thread = {"id": _new_id("thread"), "object": "thread", "created_at": int(time.time()), "metadata": {}}
+        with self._lock:
+            self.threads[thread["id"]] = {"thread": thread, "messages": []}
+        return thread
+
+    def create_message(self, thread_id, role, content, run_id=None, assistant_id=None):
+        message = {
+            "id": _new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+            "assistant_id": assistant_id,
+            "run_id": run_id,
+            "file_ids": [],
+            "metadata": {},
+        }
+        with self._lock:
+            self.threads[thread_id]["messages"].append(message)
+        return message
+
+    def list_messages(self, thread_id, order="desc", after=None, before=None, limit=20):
+        with self._lock:
+            messages = list(self.threads[thread_id]["messages"])
+        if order == "desc":
+            messages.reverse()
+        ids = [message["id"] for message in messages]
+        if after in ids:
+            messages = messages[ids.index(after) + 1:]
+        elif before in ids:
+            messages = messages[:ids.index(before)]
+        page = messages[:limit]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(messages) > limit,
+        }
+
+    # Runs
+
+    def create_run(self, thread_id, body):
+        with self._lock:
+            messages = self.threads[thread_id]["messages"]
+            last_user = next((m for m in reversed(messages) if m["role"] == "user"), None)
+        wants_tools = bool(
+            self.tool_calls and last_user and "Image URL" in last_user["content"][0]["text"]["value"]
+        )
+        # Like the model, call the tool with the picture URL given in the message
+        image_url = re.search(r"Image URL\**:\s*(\S+)", last_user["content"][0]["text"]["value"]) if wants_tools else None
+        run = {
+            "id": _new_id("run"),
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": body.get("assistant_id"),
+            "status": "queued",
+            "required_action": None,
+            "last_error": None,
+            "expires_at": None,
+            "started_at": None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "completed_at": None,
+            "model": "gpt-4-turbo-preview",
+            "instructions": body.get("instructions") or "",
+            "tools": [],
+            "file_ids": [],
+            "metadata": {},
+            "usage": None,
+        }
+        with self._lock:
+            self.runs[run["id"]] = {
+                "run": run,
+                "ready_at": time.monotonic() + self.run_latency,
+                "pending_tools": wants_tools,
+                "image_url": image_url.group(1) if image_url else None,
+            }
+        return self.get_run(run["id"])
+
+    def get_run(self, run_id):
+        with self._lock:
+            state = self.runs[run_id]
+            run = state["run"]
+            if run["status"] in ("queued", "in_progress"):
+                if time.monotonic() < state["ready_at"]:
+                    run["status"] = "in_progress"
+                    run["started_at"] = run["started_at"] or int(time.time())
+                elif state["pending_tools"]:
+                    run["status"] = "requires_action"
+                    run["required_action"] = {
+                        "type": "submit_tool_outputs",
+                        "submit_tool_outputs": {"tool_calls": [
+                            {
+                                "id": _new_id("call"),
+                                "type": "function",
+                                "function": {
+                                    "name": "analyze_profile_picture",
+                                    "arguments": json.dumps({"image_url": state["image_url"] or f"https://example.com/photo{i}.jpg"}),
+                                },
+                            }
+                            for i in range(self.tool_calls)
+                        ]},
+                    }
+                else:
+                    run["status"] = "completed"
+                    run["completed_at"] = int(time.time())
+                    run["usage"] = {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200}
+                    state["completed"] = True
+            finished = state.pop("completed", False)
+            snapshot = json.loads(json.dumps(run))
+        if finished:
+            self.create_message(run["thread_id"], "assistant", self.reply, run_id=run_id,
+                                assistant_id=run["assistant_id"])
+        return snapshot
+
+    def submit_tool_outputs(self, run_id, body):
+        with self._lock:
+            state = self.runs[run_id]
+            if state["run"]["status"] != "requires_action":
+                raise ValueError(f"Run {run_id} is not waiting for tool outputs")
+            expected = len(state["run"]["required_action"]["submit_tool_outputs"]["tool_calls"])
+            if len(body.get("tool_outputs", [])) != expected:
+                raise ValueError(f"Expected {expected} tool outputs")
+            state["run"]["status"] = "in_progress"
+            state["run"]["required_action"] = None
+            state["pending_tools"] = False
+            state["ready_at"] = time.monotonic() + self.run_latency
+        return self.get_run(run_id)
+
+    def wait_for_state_change(self, run_id):
+        """Block until the run leaves in_progress, the way a streamed run would."""
+        while True:
+            run = self.get_run(run_id)
+            if run["status"] not in ("queued", "in_progress"):
+                return run
+            with self._lock:
+                remaining = self.runs[run_id]["ready_at"] - time.monotonic()
+            time.sleep(max(remaining, 0.001))
+
+    # Assistants and files
+
+    def create_assistant(self, body):
+        assistant = {"id": _new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+                     "description": None, "metadata": {}, **body}
+        with self._lock:
+            self.assistants[assistant["id"]] = assistant
+        return assistant
+
+    def update_assistant(self, assistant_id, body):
+        with self._lock:
+            self.assistants[assistant_id].update(body)
+            return self.assistants[assistant_id]
+
+    def get_assistant(self, assistant_id):
+        with self._lock:
+            return self.assistants[assistant_id]
+
+    def create_file(self, size):
+        file = {"id": _new_id("file"), "object": "file", "bytes": size, "created_at": int(time.time()),
+                "filename": "upload.pdf", "purpose": "assistants", "status": "processed"}
+        with self._lock:
+            self.files[file["id"]] = file
+        return file
+
+    def delete_file(self, file_id):
+        with self._lock:
+            del self.files[file_id]
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    # Chat completions
+
+    def chat_completion(self, body):
+        time.sleep(self.chat_latency)
+        return {
+            "id": _new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4-vision-preview"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "The picture looks professional."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 800, "completion_tokens": 60, "total_tokens": 860},
+        }
+
+
+def _make_handler(server):
+    routes = [
+        ("POST", r"/threads", "create_thread"),
+        ("POST", r"/threads/(?P<thread_id>[^/]+)/messages", "create_message"),
+        ("GET", r"/threads/(?P<thread_id>[^/]+)/messages", "list_messages"),
+        ("POST", r"/threads/(?P<thread_id>[^/]+)/runs", "create_run"),
+        ("GET", r"/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "get_run"),
+        ("POST", r"/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/submit_tool_outputs", "submit_tool_outputs"),
+        ("POST", r"/chat/completions", "chat_completion"),
+        ("POST", r"/assistants", "create_assistant"),
+        ("GET", r"/assistants/(?P<assistant_id>[^/]+)", "get_assistant"),
+        ("POST", r"/assistants/(?P<assistant_id>[^/]+)", "update_assistant"),
+        ("POST", r"/files", "create_file"),
+        ("DELETE", r"/files/(?P<file_id>[^/]+)", "delete_file"),
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def _dispatch(self, method):
+            path, _, query = self.path.partition("?")
+            path = path[len("/v1"):] if path.startswith("/v1") else path
+            params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if self.headers.get("Content-Type", "").startswith("application/json") and raw:
+                body = json.loads(raw)
+            else:
+                # File uploads are multipart; only their size matters here
+                body = {"size": len(raw)}
+
+            for route_method, pattern, name in routes:
+                match = re.fullmatch(pattern, path)
+                if route_method == method and match:
+                    with server._lock:
+                        server.requests[name] += 1
+                    try:
+                        getattr(self, f"_{name}")(body, params, **match.groupdict())
+                    except (KeyError, ValueError) as e:
+                        self._send_json({"error": {"message": str(e), "type": "invalid_request_error"}}, 400)
+                    return
+            self._send_json({"error": {"message": f"No route for {method} {path}"}}, 404)
+
+        def _send_json(self, payload, status=200):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_events(self, events):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for event, data in events:
+                payload = data if isinstance(data, str) else json.dumps(data)
+                self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode())
+                self.wfile.flush()
+            self.close_connection = True
+
+        def _stream_run(self, run):
+            """Yield server-sent events for a run until it completes or requires action."""
+            yield "thread.run.in_progress", run
+            run = server.wait_for_state_change(run["id"])
+            if run["status"] == "requires_action":
+                yield "thread.run.requires_action", run
+                yield "done", "[DONE]"
+                return
+            messages = server.list_messages(run["thread_id"])["data"]
+            message = next(m for m in messages if m["run_id"] == run["id"])
+            yield "thread.message.created", {**message, "content": []}
+            words = message["content"][0]["text"]["value"].split(" ")
+            for i, word in enumerate(words):
+                time.sleep(server.stream_chunk_delay)
+                text = word if i == 0 else " " + word
+                yield "thread.message.delta", {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {"value": text, "annotations": []}}]},
+                }
+            yield "thread.message.completed", message
+            yield "thread.run.completed", run
+            yield "done", "[DONE]"
+
+        def _create_thread(self, body, params):
+            self._send_json(server.create_thread())
+
+        def _create_message(self, body, params, thread_id):
+            self._send_json(server.create_message(thread_id, body.get("role", "user"), body.get("content", "")))
+
+        def _list_messages(self, body, params, thread_id):
+            self._send_json(server.list_messages(
+                thread_id,
+                order=params.get("order", "desc"),
+                after=params.get("after"),
+                before=params.get("before"),
+                limit=int(params.get("limit", 20)),
+            ))
+
+        def _create_run(self, body, params, thread_id):
+            run = server.create_run(thread_id, body)
+            if body.get("stream"):
+                self._send_events(itertools.chain([("thread.run.created", run)], self._stream_run(run)))
+            else:
+                self._send_json(run)
+
+        def _get_run(self, body, params, thread_id, run_id):
+            self._send_json(server.get_run(run_id))
+
+        def _submit_tool_outputs(self, body, params, thread_id, run_id):
+            run = server.submit_tool_outputs(run_id, body)
+            if body.get("stream"):
+                self._send_events(self._stream_run(run))
+            else:
+                self._send_json(run)
+
+        def _create_assistant(self, body, params):
+            self._send_json(server.create_assistant(body))
+
+        def _get_assistant(self, body, params, assistant_id):
+            self._send_json(server.get_assistant(assistant_id))
+
+        def _update_assistant(self, body, params, assistant_id):
+            self._send_json(server.update_assistant(assistant_id, body))
+
+        def _create_file(self, body, params):
+            self._send_json(server.create_file(body["size"]))
+
+        def _delete_file(self, body, params, file_id):
+            self._send_json(server.delete_file(file_id))
+
+        def _chat_completion(self, body, params):
+            self._send_json(server.chat_completion(body))
+
+    return Handler
+
+
+def _legacy_wait(client, thread_id, run):
+    """The original app.py loop: sleep one second between every retrieve."""
+    while run.status != "completed":
+        time.sleep(1)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+    return run
+
+
+def compare(run_latency, rounds):
+    """Time the legacy polling loop against run_waiter on the fake server."""
+    from openai import OpenAI
+
+    from run_waiter import create_and_wait, wait_for_run
+
+    results = {}
+    with FakeOpenAIServer(run_latency=run_latency) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+        modes = {
+            "legacy_fixed_1s": lambda thread_id: _legacy_wait(
+                client, thread_id, client.beta.threads.runs.create(thread_id=thread_id, assistant_id="asst_test")),
+            "backoff": lambda thread_id: wait_for_run(
+                client, thread_id, client.beta.threads.runs.create(thread_id=thread_id, assistant_id="asst_test")),
+            "stream": lambda thread_id: create_and_wait(client, thread_id, "asst_test", stream=True),
+        }
+        for mode, wait in modes.items():
+            latencies = []
+            server.reset_counters()
+            for _ in range(rounds):
+                thread_id = client.beta.threads.create().id
+                start = time.perf_counter()
+                wait(thread_id)
+                latencies.append(time.perf_counter() - start)
+            results[mode] = {
+                "mean_latency_s": round(sum(latencies) / len(latencies), 3),
+                "overhead_s": round(sum(latencies) / len(latencies) - run_latency, 3),
+                "run_requests_per_run": round(
+                    (server.requests["create_run"] + server.requests["get_run"]) / rounds, 1),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI Assistants server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--run-latency", type=float, default=2.3)
+    parser.add_argument("--tool-calls", type=int, default=0)
+    parser.add_argument("--compare", action="store_true", help="Compare run waiting strategies and exit.")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare(args.run_latency, args.rounds), indent=2))
+    else:
+        fake = FakeOpenAIServer(run_latency=args.run_latency, tool_calls=args.tool_calls, port=args.port)
+        print(f"Fake OpenAI server listening on {fake.base_url}")
+        fake.start()
+        try:
+            fake._thread.join()
+        except KeyboardInterrupt:
+            fake.stop()
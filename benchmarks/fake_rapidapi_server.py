@@ -0,0 +1,119 @@
+"""
+A local stand-in for the RapidAPI LinkedIn endpoint, serving the synthetic profiles in benchmarks/fixtures
+(shaped like real API responses, every value made up) with configurable latency. Usernames starting with
+"large" get the large fixture, all others the small one.
+The profile picture URL in each response points back at this server.
+
+Point the scraper at it with `RAPIDAPI_URL=<server.base_url>`.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name):
+    """Return a synthetic RapidAPI profile response from benchmarks/fixtures, e.g. "small" or "large"."""
+    with open(os.path.join(FIXTURES_DIR, f"profile_{name}.json")) as f:
+        return json.load(f)
+
+
+class FakeRapidAPIServer:
+    """Serves fixture profiles after `latency` seconds. Usernames in `missing` get a 404."""
+
+    def __init__(self, latency=0.3, missing=(), host="127.0.0.1", port=0):
+        self.latency = latency
+        self.missing = set(missing)
+        self.requests = Counter()
+        self.fixtures = {name: load_fixture(name) for name in ("small", "large")}
+        with open(os.path.join(FIXTURES_DIR, "profile_picture.jpg"), "rb") as f:
+            self.picture = f.read()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def profile(self, username):
+        fixture = self.fixtures["large" if username.startswith("large") else "small"]
+        return dict(fixture, username=username, profilePicture=f"{self.base_url}pictures/{username}.jpg")
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.startswith("/pictures/"):
+                server.count("picture")
+                self._send(200, server.picture, "image/jpeg")
+                return
+
+            server.count("profile")
+            time.sleep(server.latency)
+            username = parse_qs(url.query).get("username", [""])[0]
+            if not username or username in server.missing:
+                self._send(404, b'{"message": "Profile not found"}', "application/json")
+                return
+            self._send(200, json.dumps(server.profile(username)).encode(), "application/json")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake RapidAPI LinkedIn profile server.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    fake = FakeRapidAPIServer(latency=args.latency, port=args.port)
+    print(f"Fake RapidAPI server listening on {fake.base_url}")
+    fake.start()
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,257 @@
+"""
+Benchmark suite for the scrape, format and analysis paths, run against the synthetic RapidAPI fixtures and the
+local fake OpenAI server, so results only depend on this code and the configured latencies.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json     # exits 1 if a metric regressed
+
+Benchmarks:
+- format:   parse (Profile.from_api) plus format_profile throughput on the small and large fixture profiles
+- scrape:   scrape_linkedin_profile throughput and latency at several concurrency levels (cache misses)
+- analysis: end-to-end latency of the app's analysis job (run_analysis), with cold and warm caches
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the app modules quiet and in-memory while benchmarking; must be set before they are imported
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["PROFILE_CACHE_BACKEND"] = "memory"
+os.environ["VISION_CACHE_BACKEND"] = "memory"
+os.environ["PICTURE_CACHE_BACKEND"] = "memory"
+os.environ["ANALYSIS_CACHE_BACKEND"] = "memory"
+# Measure the code, not the quota governor (rate_limit.py); set these to benchmark at real quotas
+os.environ.setdefault("RAPIDAPI_RPM", "1000000")
+os.environ.setdefault("OPENAI_RPM", "1000000")
+os.environ.setdefault("OPENAI_TPM", "1000000000")
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.fake_rapidapi_server import FakeRapidAPIServer, load_fixture
+
+# Relative change beyond which --baseline reports a regression
+REGRESSION_THRESHOLD = 0.15
+
+
+def percentiles(samples):
+    """Summary of latency samples (seconds) in milliseconds."""
+    ordered = sorted(samples)
+    def at(fraction):
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+    return {
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(at(0.5) * 1000, 3),
+        "p95_ms": round(at(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def bench_format(iterations):
+    from linkedin_scraper import format_profile
+    from profile_model import Profile
+
+    results = {}
+    for name in ("small", "large"):
+        profile_data = load_fixture(name)
+        format_profile(Profile.from_api(profile_data))
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            formatted = format_profile(Profile.from_api(profile_data))
+            samples.append(time.perf_counter() - start)
+        results[name] = {
+            "input_bytes": len(json.dumps(profile_data)),
+            "record_bytes": len(json.dumps(Profile.from_api(profile_data).to_record())),
+            "output_tokens": formatted.token_count,
+            "truncated": formatted.truncated,
+            "ops_per_s": round(len(samples) / sum(samples), 1),
+            **percentiles(samples),
+        }
+    return results
+
+
+def _use_fake_rapidapi(rapidapi):
+    import linkedin_scraper
+
+    linkedin_scraper.RAPIDAPI_URL = rapidapi.base_url
+    linkedin_scraper.rapidapi_key = "benchmark"
+
+
+def _clear_caches():
+    from analysis import analysis_store
+    from linkedin_scraper import profile_cache
+    from profile_picture import picture_cache, processed_picture_cache
+    from vision import vision_cache
+
+    analysis_store.clear()
+    profile_cache.backend.clear()
+    picture_cache.clear()
+    processed_picture_cache.clear()
+    vision_cache.clear()
+
+
+def bench_scrape(rapidapi, concurrency_levels, requests_per_level):
+    from linkedin_scraper import scrape_linkedin_profile
+
+    _use_fake_rapidapi(rapidapi)
+    results = {}
+    for concurrency in concurrency_levels:
+        _clear_caches()
+        rapidapi.reset_counters()
+
+        def scrape(i):
+            start = time.perf_counter()
+            text, _ = scrape_linkedin_profile(f"https://www.linkedin.com/in/bench-c{concurrency}-{i}/")
+            return time.perf_counter() - start, bool(text)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(scrape, range(requests_per_level)))
+        wall = time.perf_counter() - start
+        results[f"c{concurrency}"] = {
+            "requests": requests_per_level,
+            "failures": sum(not ok for _, ok in outcomes),
+            "upstream_requests": rapidapi.requests["profile"],
+            "wall_s": round(wall, 3),
+            "ops_per_s": round(requests_per_level / wall, 2),
+            **percentiles([latency for latency, _ in outcomes]),
+        }
+    return results
+
+
+def bench_analysis(rapidapi, openai_server, rounds):
+    from openai import OpenAI
+
+    from analysis import run_analysis
+    from knowledge_index import get_index
+
+    _use_fake_rapidapi(rapidapi)
+    client = OpenAI(api_key="benchmark", base_url=openai_server.base_url)
+    # Build or load the knowledge index up front so it isn't part of the first round
+    get_index()
+
+    results = {}
+    for mode in ("cold", "warm"):
+        samples = []
+        stages = {}
+        openai_server.reset_counters()
+        for i in range(rounds):
+            if mode == "cold":
+                _clear_caches()
+            start = time.perf_counter()
+            result = run_analysis(client, "asst_benchmark", "https://www.linkedin.com/in/bench-analysis/")
+            samples.append(time.perf_counter() - start)
+            if not result["report"]:
+                raise RuntimeError(f"Analysis returned no report: {result}")
+            for stage, seconds in result["timings"].items():
+                stages.setdefault(stage, []).append(seconds)
+        results[mode] = {
+            "rounds": rounds,
+            "openai_requests_per_analysis": round(openai_server.total_requests() / rounds, 1),
+            **percentiles(samples),
+            "stage_mean_ms": {stage: round(statistics.fmean(values) * 1000, 3) for stage, values in stages.items()},
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    config = {
+        "format_iterations": args.format_iterations,
+        "scrape_concurrency": args.concurrency,
+        "scrape_requests": args.scrape_requests,
+        "rapidapi_latency_s": args.rapidapi_latency,
+        "run_latency_s": args.run_latency,
+        "chat_latency_s": args.chat_latency,
+        "analysis_rounds": args.rounds,
+    }
+    results = {}
+    if "format" in args.only:
+        results["format"] = bench_format(args.format_iterations)
+    with FakeRapidAPIServer(latency=args.rapidapi_latency) as rapidapi:
+        if "scrape" in args.only:
+            results["scrape"] = bench_scrape(rapidapi, args.concurrency, args.scrape_requests)
+        if "analysis" in args.only:
+            with FakeOpenAIServer(run_latency=args.run_latency, chat_latency=args.chat_latency, tool_calls=1) as openai_server:
+                results["analysis"] = bench_analysis(rapidapi, openai_server, args.rounds)
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": round(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+        },
+        "results": results,
+    }
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def find_regressions(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two suite outputs. Throughput (`*_per_s`) must not drop and mean/p50/p95 latencies must not
+    grow by more than `threshold`. Maxima are single samples and too noisy to compare.
+    """
+    before = dict(_flatten(baseline["results"]))
+    regressions = []
+    for name, value in _flatten(current["results"]):
+        old = before.get(name)
+        if not old:
+            continue
+        change = (value - old) / old
+        if (name.endswith("_per_s") and change < -threshold) or (name.endswith(("mean_ms", "p50_ms", "p95_ms")) and change > threshold):
+            regressions.append({"metric": name, "baseline": old, "current": value, "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrape, format and analysis paths.")
+    parser.add_argument("--only", nargs="+", choices=["format", "scrape", "analysis"],
+                        default=["format", "scrape", "analysis"])
+    parser.add_argument("--format-iterations", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--scrape-requests", type=int, default=64, help="Scrapes per concurrency level.")
+    parser.add_argument("--rapidapi-latency", type=float, default=0.3)
+    parser.add_argument("--run-latency", type=float, default=1.0)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--rounds", type=int, default=5, help="Analyses per cache mode.")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    parser.add_argument("--baseline", help="Earlier results to compare against; exit 1 on regressions.")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = find_regressions(json.load(f), report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
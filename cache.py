@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# A cached value together with the time it was stored
+CacheEntry = namedtuple("CacheEntry", ["value", "stored_at"])
+
+
+class MemoryCache:
+    """In-process LRU cache. Entries older than `ttl` seconds are dropped on read."""
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry.stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = CacheEntry(value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCache:
+    """On-disk cache backed by a single SQLite table. Values must be JSON serializable."""
+
+    def __init__(self, path, namespace="default", ttl=None, max_entries=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._conn.commit()
+                return None
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (time.time(), self.namespace, key),
+                )
+                self._conn.commit()
+        return CacheEntry(json.loads(value), stored_at)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            if self.max_entries is not None:
+                # Evict the least recently used rows beyond the limit
+                self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key NOT IN ("
+                    "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.namespace, self.namespace, self.max_entries),
+                )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+
+def make_cache(namespace, backend=None, path=None, ttl=None, max_entries=256):
+    """
+    Build a cache backend from explicit arguments or the CACHE_BACKEND / CACHE_PATH environment variables.
+    Supported backends are "memory" (default) and "sqlite".
+    """
+    backend = backend or os.getenv("CACHE_BACKEND", "memory")
+    if backend == "sqlite":
+        path = path or os.getenv("CACHE_PATH", os.path.join(".cache", "reviewin.sqlite3"))
+        return SqliteCache(path, namespace=namespace, ttl=ttl, max_entries=max_entries)
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for a cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "errors": self.errors,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+class CachedLoader:
+    """
+    Read-through cache with stale-while-revalidate.
+
+    Entries younger than `ttl` are served as is. Entries between `ttl` and `ttl + stale_ttl` are served
+    immediately while a background refresh replaces them. Anything older is reloaded synchronously.
+    The loader returns None for failures, which are never cached. `async_loader`, if given, is the
+    coroutine version of `loader` used by `aget`; background refreshes always use `loader`.
+    """
+
+    def __init__(self, backend, loader, ttl=6 * 3600, stale_ttl=24 * 3600, async_loader=None):
+        self.backend = backend
+        self.loader = loader
+        self.async_loader = async_loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = CacheStats()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+    def get(self, key, *args, **kwargs):
+        entry = self._lookup(key, args, kwargs)
+        if entry is not None:
+            return entry.value
+        return self._load(key, args, kwargs)
+
+    async def aget(self, key, *args, **kwargs):
+        entry = self._lookup(key, args, kwargs)
+        if entry is not None:
+            return entry.value
+        try:
+            value = await self.async_loader(*args, **kwargs)
+        except Exception:
+            self.stats.incr("errors")
+            raise
+        return self._store(key, value)
+
+    def _lookup(self, key, args, kwargs):
+        """Return a servable entry (scheduling a refresh if it is stale), or None on a miss."""
+        entry = self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age <= self.ttl:
+                self.stats.incr("hits")
+                return entry
+            if age <= self.ttl + self.stale_ttl:
+                self.stats.incr("stale_hits")
+                self._refresh_in_background(key, args, kwargs)
+                return entry
+
+        self.stats.incr("misses")
+        return None
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def _load(self, key, args, kwargs):
+        try:
+            value = self.loader(*args, **kwargs)
+        except Exception:
+            self.stats.incr("errors")
+            raise
+        return self._store(key, value)
+
+    def _store(self, key, value):
+        if value is None:
+            self.stats.incr("errors")
+        else:
+            self.backend.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key, args, kwargs):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.stats.incr("refreshes")
+                self._load(key, args, kwargs)
+            except Exception:
+                logging.exception(f"Background refresh failed for cache key {key}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+# Explicit timeouts so one slow upstream can't block a worker indefinitely
+HTTP_TIMEOUT = httpx.Timeout(
+    connect=float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+    read=float(os.getenv('HTTP_READ_TIMEOUT', 20)),
+    write=10.0,
+    pool=10.0,
+)
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+MAX_RETRY_AFTER = 60
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def _get_loop():
+    """
+    Return the event loop that owns the shared client, starting it on a daemon thread on first use.
+    An httpx.AsyncClient is bound to one loop, so all requests run there and callers on other
+    threads or loops hand their coroutines over to it.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="http-client-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _client
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared client loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+async def run_async(coro):
+    """Run a coroutine on the shared client loop and await it from any event loop."""
+    if asyncio.get_running_loop() is _loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_loop()))
+
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header given as seconds or an HTTP date. Returns None if absent or invalid."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _request(method, url, max_retries, retry_statuses=RETRY_STATUS_CODES, **kwargs):
+    client = _get_client()
+    for attempt in range(max_retries + 1):
+        backoff = min(0.5 * 2 ** attempt, MAX_RETRY_AFTER) * random.uniform(0.8, 1.2)
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            logging.warning(f"{method} {url} failed ({e!r}), retrying in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+            continue
+
+        if response.status_code in retry_statuses and attempt < max_retries:
+            retry_after = retry_after_seconds(response)
+            delay = min(retry_after, MAX_RETRY_AFTER) if retry_after is not None else backoff
+            logging.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        return response
+
+
+async def request_async(method, url, max_retries=HTTP_MAX_RETRIES, retry_statuses=RETRY_STATUS_CODES, **kwargs):
+    """
+    Send a request through the shared keep-alive connection pool, retrying connection errors and
+    `retry_statuses` responses (429/5xx by default) with exponential backoff (honoring Retry-After).
+    Returns the last response.
+    """
+    return await run_async(_request(method, url, max_retries, retry_statuses, **kwargs))
+
+
+def request(method, url, max_retries=HTTP_MAX_RETRIES, retry_statuses=RETRY_STATUS_CODES, **kwargs):
+    """Synchronous version of request_async for code that isn't running an event loop."""
+    return run_sync(_request(method, url, max_retries, retry_statuses, **kwargs))
+
+
+class ResponseTooLargeError(Exception):
+    """Raised by download when the response body is larger than allowed."""
+
+
+def download(url, max_bytes, max_retries=HTTP_MAX_RETRIES, **kwargs):
+    """
+    GET `url` and return the body, retrying connection errors. Raises httpx.HTTPStatusError for error
+    responses and ResponseTooLargeError once the body (announced or actually read) exceeds `max_bytes`,
+    without reading the rest.
+    """
+    return run_sync(_download(url, max_bytes, max_retries, **kwargs))
+
+
+async def _download(url, max_bytes, max_retries, **kwargs):
+    client = _get_client()
+    for attempt in range(max_retries + 1):
+        try:
+            async with client.stream("GET", url, **kwargs) as response:
+                response.raise_for_status()
+                length = response.headers.get("content-length")
+                if length and length.isdigit() and int(length) > max_bytes:
+                    raise ResponseTooLargeError(f"{url} is {length} bytes, over the {max_bytes} byte limit")
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > max_bytes:
+                        raise ResponseTooLargeError(f"{url} is over the {max_bytes} byte limit")
+                return bytes(body)
+        except httpx.TransportError as e:
+            if attempt == max_retries:
+                raise
+            backoff = min(0.5 * 2 ** attempt, MAX_RETRY_AFTER) * random.uniform(0.8, 1.2)
+            logging.warning(f"GET {url} failed ({e!r}), retrying in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StageTimer:
+    """
+    Collects wall-clock durations (in seconds) of named pipeline stages. Safe to use from worker threads.
+    Each stage is also recorded in the process-wide `stage_seconds` summary.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.durations[name] = self.durations.get(name, 0.0) + duration
+            metrics.observe("stage_seconds", duration, stage=name)
+
+    def timed(self, name, func, *args, **kwargs):
+        """Return a zero-argument callable running `func` inside the named stage, for executor.submit."""
+        def call():
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return call
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def as_dict(self):
+        with self._lock:
+            timings = {name: round(seconds, 3) for name, seconds in self.durations.items()}
+        timings["total"] = round(self.elapsed(), 3)
+        return timings
+
+
+# Payload logging is sampled and truncated: full API responses are large and logging them on every
+# request costs more than the request handling itself
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv('PAYLOAD_LOG_SAMPLE_RATE', 0.01))
+PAYLOAD_LOG_MAX_CHARS = int(os.getenv('PAYLOAD_LOG_MAX_CHARS', 1000))
+
+METRICS_PREFIX = "reviewin"
+
+metrics_logger = logging.getLogger("reviewin.metrics")
+payload_logger = logging.getLogger("reviewin.payloads")
+
+
+class Metrics:
+    """
+    Process-wide counters and duration summaries keyed by name and labels, exported as Prometheus text
+    (`render_prometheus`) or a JSON-ready dict (`as_dict`). Collectors registered with `register_collector`
+    are called on export and return (name, labels, value) samples, e.g. for cache hit rates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._collectors = []
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _samples(self):
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: list(summary) for key, summary in self._summaries.items()}
+            collectors = list(self._collectors)
+        gauges = {}
+        for collector in collectors:
+            for name, labels, value in collector():
+                gauges[(name, tuple(sorted(labels.items())))] = value
+        return counters, summaries, gauges
+
+    def as_dict(self):
+        counters, summaries, gauges = self._samples()
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "summaries": [{"name": name, "labels": dict(labels), "count": count, "sum": round(total, 6),
+                           "max": round(peak, 6)}
+                          for (name, labels), (count, total, peak) in sorted(summaries.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(gauges.items())],
+        }
+
+    def render_prometheus(self):
+        counters, summaries, gauges = self._samples()
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(labels)} {value}")
+        for (name, labels), (count, total, peak) in sorted(summaries.items()):
+            lines.append(f"{METRICS_PREFIX}_{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{METRICS_PREFIX}_{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{METRICS_PREFIX}_{name}_max{_format_labels(labels)} {peak:.6f}")
+        for (name, labels), value in sorted(gauges.items()):
+            lines.append(f"{METRICS_PREFIX}_{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block into the `span_seconds` summary, and count it as failed if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.incr("span_errors_total", span=name, **labels)
+        raise
+    finally:
+        metrics.observe("span_seconds", time.perf_counter() - start, span=name, **labels)
+
+
+def record_usage(source, usage):
+    """Count the tokens of an OpenAI usage object (run or chat completion) under `source`."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            metrics.incr("openai_tokens_total", tokens, source=source, kind=kind[:-len("_tokens")])
+
+
+def register_cache_stats(cache, stats):
+    """Export a CacheStats' counters and hit rate as gauges labelled with the cache name."""
+    def collect():
+        counts = stats.as_dict()
+        hit_rate = counts.pop("hit_rate")
+        samples = [("cache_events", {"cache": cache, "event": event}, value) for event, value in counts.items()]
+        samples.append(("cache_hit_rate", {"cache": cache}, round(hit_rate, 4)))
+        return samples
+    metrics.register_collector(collect)
+
+
+def log_event(event, **fields):
+    """Write one structured JSON log line, e.g. the timings and token usage of a finished analysis."""
+    if metrics_logger.isEnabledFor(logging.INFO):
+        metrics_logger.info(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, default=str))
+
+
+def log_payload(label, payload, sample_rate=None, max_chars=None):
+    """
+    Log a sample of large payloads (API responses, prompts) at DEBUG level, truncated to `max_chars`.
+    Nothing is serialized unless DEBUG is enabled and the payload is sampled.
+    """
+    sample_rate = PAYLOAD_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if not payload_logger.isEnabledFor(logging.DEBUG) or random.random() >= sample_rate:
+        return
+    max_chars = PAYLOAD_LOG_MAX_CHARS if max_chars is None else max_chars
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+    payload_logger.debug(f"{label}: {text}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = metrics.render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(metrics.as_dict()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics (Prometheus text) and /metrics.json on a daemon thread. Safe to call repeatedly."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _metrics_server
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 16))
+# How long finished jobs are kept, so a rerun of the page can still pick up the result
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 600))
+# SQLite file shared by all worker processes of the service (see service.py). Unset: jobs stay in-process.
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH')
+# Least time between progress writes to the shared store while a job streams output
+JOB_PROGRESS_INTERVAL = 0.25
+
+
+class Job:
+    """A unit of background work. `progress` holds partial output (e.g. streamed text) while it runs."""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.progress = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        # Called after each progress update, e.g. to mirror the job into a JobStore
+        self._on_progress = None
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def append_progress(self, text):
+        with self._lock:
+            self.progress += text
+        if self._on_progress:
+            self._on_progress(self)
+
+    def to_dict(self):
+        """JSON-serializable snapshot of the job; the error becomes its message."""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": str(self.error) if self.error is not None else None,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data, key=None):
+        job = cls(key)
+        job.id = data["id"]
+        job.status = data["status"]
+        job.progress = data["progress"]
+        job.result = data["result"]
+        job.error = data["error"]
+        job.created_at = data["created_at"]
+        job.finished_at = data["finished_at"]
+        return job
+
+
+class SqliteJobStore:
+    """
+    Job state in a SQLite file (WAL mode), so the worker processes of the service can coalesce submissions
+    and serve each other's jobs. A job runs in the process that created it; rows of jobs whose process
+    has exited without finishing them read as failed.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT NOT NULL, pid INTEGER NOT NULL, status TEXT NOT NULL, "
+            "progress TEXT NOT NULL, result TEXT, error TEXT, created_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+
+    def claim(self, job, result_ttl):
+        """
+        Insert `job` unless a job with the same key is still queued or running. Returns that existing job,
+        or None if `job` was inserted. Finished jobs older than `result_ttl` seconds are deleted.
+        """
+        key = _key_text(job.key)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - result_ttl,))
+                for row in self._conn.execute(
+                    "SELECT * FROM jobs WHERE key = ? AND finished_at IS NULL ORDER BY created_at DESC", (key,)
+                ).fetchall():
+                    existing = self._job(row)
+                    if not existing.done:
+                        self._conn.execute("COMMIT")
+                        return existing
+                self._conn.execute(
+                    "INSERT INTO jobs (id, key, pid, status, progress, result, error, created_at, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, NULL, ?, NULL)",
+                    (job.id, key, os.getpid(), job.status, job.progress, job.created_at),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None
+
+    def save(self, job):
+        data = job.to_dict()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (data["status"], data["progress"], json.dumps(data["result"]), data["error"], data["finished_at"], job.id),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def _job(self, row):
+        job_id, key, pid, status, progress, result, error, created_at, finished_at = row
+        job = Job.from_dict({
+            "id": job_id, "status": status, "progress": progress, "result": json.loads(result) if result else None,
+            "error": error, "created_at": created_at, "finished_at": finished_at,
+        }, key=key)
+        if not job.done and not _process_alive(pid):
+            job.status, job.error, job.finished_at = "failed", "The worker running this job exited", time.time()
+        return job
+
+
+def _key_text(key):
+    return json.dumps(key, default=str)
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded worker pool. Submissions are keyed: while a job with the same key is queued or
+    running, submitting again returns that job instead of starting a new one. Once it has finished, the
+    same submission starts a new job (e.g. a re-analysis after the user edited their profile).
+
+    With a `store` (SqliteJobStore), job state is mirrored into it, so several processes sharing the store
+    coalesce submissions across processes and can look up any of their jobs. Jobs always run locally.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL, store=None):
+        self.result_ttl = result_ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *args, **kwargs):
+        """Run func(job, *args, **kwargs) in the background, or return the existing job for `key`."""
+        with self._lock:
+            self._purge()
+            existing = self._by_key.get(key)
+            if existing is not None and not existing.done:
+                return existing
+            job = Job(key)
+            if self.store is not None:
+                existing = self.store.claim(job, self.result_ttl)
+                if existing is not None:
+                    return existing
+                job._on_progress = self._progress_writer()
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.get(job_id)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.status = "running"
+        self._save(job)
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = "succeeded"
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            job.error = e
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+
+    def _save(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except Exception:
+            logging.exception(f"Failed to save job {job.id} to the job store")
+
+    def _progress_writer(self):
+        # Streamed output arrives a few characters at a time; write it out at most every JOB_PROGRESS_INTERVAL
+        last_write = [0.0]
+        def on_progress(job):
+            now = time.monotonic()
+            if now - last_write[0] >= JOB_PROGRESS_INTERVAL:
+                last_write[0] = now
+                self._save(job)
+        return on_progress
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide job queue, shared by all Streamlit sessions (or service requests). With
+    JOB_STORE_PATH set, job state is shared with the other processes using that store.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(store=SqliteJobStore(JOB_STORE_PATH) if JOB_STORE_PATH else None)
+        return _queue
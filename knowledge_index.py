@@ -0,0 +1,227 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+
+import numpy as np
+from pypdf import PdfReader
+
+KNOWLEDGE_DIR = "knowledge"
+KNOWLEDGE_INDEX_DIR = os.getenv('KNOWLEDGE_INDEX_DIR', os.path.join(".cache", "knowledge_index"))
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 40
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = set(
+    "a an and are as at be but by can do for from has have how i if in into is it its me my no not of on or our "
+    "so that the their them then there these they this to up was we what when which who will with you your".split()
+)
+
+# A passage returned by a search, with the PDF it came from
+Passage = namedtuple("Passage", ["source", "text", "score"])
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_text(path):
+    reader = PdfReader(path)
+    text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    # NFKC turns ligatures like "ﬁ" into plain letters
+    return unicodedata.normalize("NFKC", text)
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping windows of `chunk_words` words."""
+    words = text.split()
+    step = chunk_words - overlap
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, max(len(words) - overlap, 1), step)]
+
+
+class KnowledgeIndex:
+    """
+    BM25 index over chunks of the knowledge PDFs, persisted in `index_dir`.
+
+    Postings are stored as flat numpy arrays (CSR layout: per-term offsets into chunk ids and term
+    frequencies) and memory-mapped on load. Chunking results are kept per file content hash, so a
+    rebuild only re-extracts the PDFs that changed.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        with open(os.path.join(index_dir, "chunks.json")) as f:
+            self.chunks = json.load(f)
+        self.files = manifest["files"]
+        self.vocab = manifest["vocab"]
+        self.avg_length = manifest["avg_length"]
+        self.term_offsets = np.load(os.path.join(index_dir, "term_offsets.npy"), mmap_mode="r")
+        self.postings_chunks = np.load(os.path.join(index_dir, "postings_chunks.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(index_dir, "postings_tf.npy"), mmap_mode="r")
+        self.chunk_lengths = np.load(os.path.join(index_dir, "chunk_lengths.npy"), mmap_mode="r")
+
+    @classmethod
+    def load_or_build(cls, knowledge_dir=KNOWLEDGE_DIR, index_dir=KNOWLEDGE_INDEX_DIR):
+        """Load the index, rebuilding it first if any PDF was added, removed or changed."""
+        files = {
+            os.path.basename(path): file_hash(path)
+            for path in sorted(glob.glob(os.path.join(knowledge_dir, "*.pdf")))
+        }
+        manifest_path = os.path.join(index_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f).get("files") == files:
+                    return cls(index_dir)
+        build_index(knowledge_dir, index_dir, files)
+        return cls(index_dir)
+
+    def search(self, query, k=4):
+        """Return the `k` best matching passages for a query, best first."""
+        n_chunks = len(self.chunks)
+        if not n_chunks:
+            return []
+        scores = np.zeros(n_chunks, dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            chunk_ids = self.postings_chunks[start:end]
+            tf = self.postings_tf[start:end]
+            idf = math.log(1 + (n_chunks - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+            norm = K1 * (1 - B + B * self.chunk_lengths[chunk_ids] / self.avg_length)
+            # Repeated query terms count with diminishing weight
+            scores[chunk_ids] += idf * tf * (K1 + 1) / (tf + norm) * (1 + math.log(query_tf))
+
+        k = min(k, n_chunks)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Passage(self.chunks[i]["source"], self.chunks[i]["text"], float(scores[i]))
+            for i in top if scores[i] > 0
+        ]
+
+
+def build_index(knowledge_dir, index_dir, files):
+    """Write the index files for the PDFs in `files` (name -> content hash)."""
+    chunk_dir = os.path.join(index_dir, "files")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    chunks = []
+    for name, digest in files.items():
+        cached_path = os.path.join(chunk_dir, f"{digest}.json")
+        if os.path.exists(cached_path):
+            with open(cached_path) as f:
+                file_chunks = json.load(f)
+        else:
+            logging.info(f"Indexing {name}")
+            file_chunks = chunk_text(extract_text(os.path.join(knowledge_dir, name)))
+            _save_json(cached_path, file_chunks)
+        chunks.extend({"source": name, "text": text} for text in file_chunks)
+
+    # Drop chunk files of PDFs that changed or were removed
+    for path in glob.glob(os.path.join(chunk_dir, "*.json")):
+        if os.path.basename(path)[:-len(".json")] not in files.values():
+            os.remove(path)
+
+    postings = {}
+    lengths = []
+    for chunk_id, chunk in enumerate(chunks):
+        terms = Counter(tokenize(chunk["text"]))
+        lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((chunk_id, tf))
+
+    vocab = {term: term_id for term_id, term in enumerate(sorted(postings))}
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    chunk_ids, tfs = [], []
+    for term, term_id in vocab.items():
+        offsets[term_id + 1] = offsets[term_id] + len(postings[term])
+        for chunk_id, tf in postings[term]:
+            chunk_ids.append(chunk_id)
+            tfs.append(tf)
+
+    _save_array(os.path.join(index_dir, "term_offsets.npy"), offsets)
+    _save_array(os.path.join(index_dir, "postings_chunks.npy"), np.array(chunk_ids, dtype=np.int32))
+    _save_array(os.path.join(index_dir, "postings_tf.npy"), np.array(tfs, dtype=np.float32))
+    _save_array(os.path.join(index_dir, "chunk_lengths.npy"), np.array(lengths, dtype=np.float32))
+    _save_json(os.path.join(index_dir, "chunks.json"), chunks)
+    # The manifest is written last, so an interrupted build is redone on the next load
+    _save_json(os.path.join(index_dir, "manifest.json"), {
+        "files": files,
+        "vocab": vocab,
+        "avg_length": sum(lengths) / len(lengths) if lengths else 1.0,
+    })
+
+
+def _save_array(path, array):
+    """Write next to the final path and rename into place, so readers that mmap the old file keep it intact."""
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _save_json(path, data):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _tmp_path(path):
+    # Per process, so service workers building the index at the same time don't write into one file
+    return f"{path}.{os.getpid()}.tmp"
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the shared index, loading or building it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = KnowledgeIndex.load_or_build()
+        return _index
+
+
+def search_knowledge(query, k=4):
+    """Top-k knowledge base passages for a query. Returns [] if the index can't be built."""
+    try:
+        return get_index().search(query, k)
+    except Exception:
+        logging.exception("Knowledge base search failed")
+        return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the local knowledge base index.")
+    parser.add_argument("query", help="Text to search for.")
+    parser.add_argument("-k", type=int, default=4, help="Number of passages to return.")
+    args = parser.parse_args()
+
+    for passage in search_knowledge(args.query, args.k):
+        print(f"[{passage.source} {passage.score:.2f}] {passage.text}\n")
@@ -1,15 +1,40 @@
 import os
-import requests
 import argparse
 import logging
+from collections import namedtuple
+from urllib.parse import unquote, urlparse
 from dotenv import load_dotenv
 
-# Set up basic configuration for logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+import httpx
+
+import http_client
+from cache import CachedLoader, make_cache
+from instrumentation import log_payload, metrics, register_cache_stats, span
+from profile_model import Profile
+from rate_limit import OverloadedError, current_user, get_governor
+
+# Set up basic configuration for logging. Raw API responses are only logged as samples (see log_payload).
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s - %(levelname)s - %(message)s')
 
 load_dotenv()
 rapidapi_key = os.getenv('RAPIDAPI_KEY')
 
+# Scraped profiles are cached per username: fresh for PROFILE_CACHE_TTL seconds, then served stale
+# for up to PROFILE_CACHE_STALE_TTL more seconds while a background refresh runs.
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 6 * 3600))
+PROFILE_CACHE_STALE_TTL = int(os.getenv('PROFILE_CACHE_STALE_TTL', 24 * 3600))
+
+# Overridable, e.g. to point at benchmarks/fake_rapidapi_server.py
+RAPIDAPI_URL = os.getenv('RAPIDAPI_URL', "https://linkedin-api8.p.rapidapi.com/")
+RAPIDAPI_HOST = "linkedin-api8.p.rapidapi.com"
+# Seconds to pause RapidAPI calls after a 429 without a Retry-After header
+RAPIDAPI_THROTTLE_PAUSE = 10
+
+
+class ProfileFetchError(RuntimeError):
+    """RapidAPI failed (5xx or unreachable) after retries. Unlike a missing or private profile, worth retrying later."""
+
+
 def main(profile_url):
     formatted_text, profile_image_url = scrape_linkedin_profile(profile_url)
     if formatted_text:  # Just check if formatted_text is not None or empty
@@ -28,110 +53,285 @@ def scrape_linkedin_profile(profile_url):
         logging.error("RapidAPI key not found. Please set the RAPIDAPI_KEY environment variable.")
         return None, None
 
-    url = "https://linkedin-api8.p.rapidapi.com/"
+    cached = profile_cache.get(f"profile:{username}", username)
+    if not cached:
+        return None, None
+    return cached["formatted_text"], cached["profile_image_url"]
+
+async def scrape_linkedin_profile_async(profile_url):
+    """Async version of scrape_linkedin_profile, sharing its cache."""
+    username = extract_username(profile_url)
+    if not rapidapi_key:
+        logging.error("RapidAPI key not found. Please set the RAPIDAPI_KEY environment variable.")
+        return None, None
+
+    cached = await profile_cache.aget(f"profile:{username}", username)
+    if not cached:
+        return None, None
+    return cached["formatted_text"], cached["profile_image_url"]
+
+def cached_profile(profile_url):
+    """The parsed Profile of a scraped profile from the cache, or None."""
+    entry = profile_cache.backend.get(f"profile:{extract_username(profile_url)}")
+    if entry is None or "profile" not in entry.value:
+        return None
+    return Profile.from_record(entry.value["profile"])
+
+def invalidate_profile(profile_url):
+    """Drop a profile from the cache, so the next scrape fetches it from RapidAPI."""
+    profile_cache.invalidate(f"profile:{extract_username(profile_url)}")
+
+def is_profile_cached(profile_url):
+    """True if the profile can be served from the cache (fresh or stale) without calling RapidAPI."""
+    return profile_cache.backend.get(f"profile:{extract_username(profile_url)}") is not None
+
+def load_profile(username):
+    """Fetch and format a profile. Returns the cache record, or None if the profile could not be loaded."""
+    return _profile_record(fetch_profile_data(username))
+
+async def load_profile_async(username):
+    return _profile_record(await fetch_profile_data_async(username))
+
+def _profile_record(profile_data):
+    if profile_data is None:
+        return None
+    with span("format_profile"):
+        try:
+            profile = Profile.from_api(profile_data)
+        except Exception:
+            logging.exception("An error occurred while parsing the profile data.")
+            return None
+        formatted = format_profile(profile)
+    if not formatted or not formatted.text:
+        return None
+    metrics.observe("profile_tokens", formatted.token_count)
+    log_payload("Formatted profile", formatted.text)
+    return {
+        "profile": profile.to_record(),
+        "formatted_text": formatted.text,
+        "profile_image_url": formatted.profile_image_url,
+        "token_count": formatted.token_count,
+    }
+
+def fetch_profile_data(username):
+    """
+    Fetch the raw profile JSON from the RapidAPI endpoint. Returns None if there is no such (public) profile.
+    Raises OverloadedError when the RapidAPI quota is exhausted and ProfileFetchError when RapidAPI fails, so
+    callers can tell "busy" and "failed" apart from "no such profile".
+    """
+    return http_client.run_sync(_fetch_profile_data(username, current_user.get()))
+
+async def fetch_profile_data_async(username):
+    """Async version of fetch_profile_data. Can be awaited from any event loop."""
+    return await http_client.run_async(_fetch_profile_data(username, current_user.get()))
+
+async def _fetch_profile_data(username, user=None):
     querystring = {"username": username}
 
     headers = {
         "X-RapidAPI-Key": rapidapi_key,
-        "X-RapidAPI-Host": "linkedin-api8.p.rapidapi.com"
+        "X-RapidAPI-Host": RAPIDAPI_HOST
     }
 
+    # Queue for the shared RapidAPI quota; raises OverloadedError right away if the queue is too long
+    governor = get_governor("rapidapi")
+    await governor.acquire_async(user)
     try:
-        response = requests.get(url, headers=headers, params=querystring)
+        with span("rapidapi_fetch"):
+            # 429s are the governor's to handle (pause and shed below), so only 5xx and connection errors are retried
+            response = await http_client.request_async(
+                "GET", RAPIDAPI_URL, headers=headers, params=querystring,
+                retry_statuses=http_client.RETRY_STATUS_CODES - {429},
+            )
+        metrics.incr("rapidapi_responses_total", status=response.status_code)
+        governor.update_from_headers(response.headers)
         if response.status_code == 200:
             profile_data = response.json()
-            logging.debug(f"API Response: {profile_data}")
-            formatted_text, profile_image_url = format_data_for_gpt(profile_data)
-            # Additional logging to confirm data formatting
-            logging.debug(f"Formatted Text: {formatted_text[:500]}")
-            logging.debug(f"Profile Image URL: {profile_image_url}")
-            return formatted_text, profile_image_url
+            log_payload("RapidAPI response", profile_data)
+            return profile_data
+        elif response.status_code == 429:
+            retry_after = http_client.retry_after_seconds(response) or RAPIDAPI_THROTTLE_PAUSE
+            governor.penalize(retry_after)
+            raise OverloadedError("RapidAPI", retry_after)
+        elif response.status_code >= 500:
+            raise ProfileFetchError(f"RapidAPI failed with status {response.status_code}")
         else:
             logging.error(f"Failed to fetch profile data. Status Code: {response.status_code}")
-            return None, None
+            return None
+    except (OverloadedError, ProfileFetchError):
+        raise
+    except httpx.TransportError as e:
+        raise ProfileFetchError(f"RapidAPI could not be reached: {e!r}") from e
     except Exception as e:
         logging.exception("An error occurred while fetching the profile data.")
-        return None, None
+        return None
 
 def extract_username(linkedin_url):
-    username = linkedin_url.split('/')[-1] if linkedin_url.split('/')[-1] else linkedin_url.split('/')[-2]
-    return username.strip()
+    """
+    Normalize a LinkedIn profile URL (or bare username) to its username, e.g.
+    "https://www.linkedin.com/in/Jane-Doe/?utm_source=share" -> "jane-doe".
+    """
+    path = urlparse(linkedin_url.strip()).path
+    parts = [part for part in path.split('/') if part]
+    username = parts[-1] if parts else linkedin_url
+    return unquote(username).strip().lower()
 
-import logging
+profile_cache = CachedLoader(
+    make_cache(
+        "profiles",
+        backend=os.getenv('PROFILE_CACHE_BACKEND'),
+        path=os.getenv('PROFILE_CACHE_PATH'),
+        ttl=PROFILE_CACHE_TTL + PROFILE_CACHE_STALE_TTL,
+    ),
+    load_profile,
+    async_loader=load_profile_async,
+    ttl=PROFILE_CACHE_TTL,
+    stale_ttl=PROFILE_CACHE_STALE_TTL,
+)
+register_cache_stats("profiles", profile_cache.stats)
+
+# Default prompt size for the formatted profile, in (estimated) tokens
+PROFILE_TOKEN_BUDGET = int(os.getenv('PROFILE_TOKEN_BUDGET', 2500))
+
+# Result of format_profile: the prompt text, the picture URL, its estimated token count and whether
+# anything had to be shortened or dropped to fit the budget
+FormattedProfile = namedtuple("FormattedProfile", ["text", "profile_image_url", "token_count", "truncated"])
+
+def estimate_tokens(text):
+    """Rough token count for English text (about 4 characters per token)."""
+    return (len(text) + 3) // 4
 
-def safe_get_list(data, key):
+def truncate_to_tokens(text, max_tokens):
+    """Cut text at a word boundary so it fits in max_tokens, marking the cut with an ellipsis."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(max_chars - 1, 0)].rsplit(" ", 1)[0]
+    return cut + "…" if cut else ""
+
+def format_data_for_gpt(profile_data, token_budget=PROFILE_TOKEN_BUDGET):
+    """Format a raw RapidAPI response. Returns (text, picture URL), or (None, None) on failure."""
+    try:
+        profile = Profile.from_api(profile_data)
+    except Exception:
+        logging.exception("An error occurred while parsing the profile data.")
+        return None, None
+    formatted = format_profile(profile, token_budget)
+    if formatted is None:
+        return None, None
+    return formatted.text, formatted.profile_image_url
+
+def format_profile(profile, token_budget=PROFILE_TOKEN_BUDGET):
     """
-    Safely get a list value from a dictionary. Returns an empty list if the key is not found or the value is None.
+    Serialize a Profile into compact prompt text of at most `token_budget` estimated tokens (None for no
+    limit). Empty fields are left out and absent key sections are listed once on a "Missing:" line.
+    Descriptions are the first thing to be shortened: the summary and the most recent roles keep theirs
+    longest. If even the bare entries don't fit, the least important ones are dropped.
+    Returns a FormattedProfile, or None if the profile could not be formatted.
     """
-    value = data.get(key)
-    return [] if value is None else value
+    try:
+        # Each entry is [order, priority, text, detail]: entries are written in `order`, budget goes to
+        # the lowest `priority` first, and `detail` is the part that can be shortened
+        entries = []
+        def add(order, priority, text, detail=""):
+            entries.append([order, priority, text, detail])
 
-def safe_get_value(data, key, default=''):
-    """Safely get a single value from a dictionary. Returns a default value if the key is not found or the value is None."""
-    return data.get(key) if data.get(key) is not None else default
+        full_name = profile.full_name
+        header = [
+            f"Name: {full_name}" if full_name else "",
+            f"Headline: {profile.headline}" if profile.headline else "",
+            f"Location: {profile.location}" if profile.location else "",
+        ]
+        missing = [name for name, present in (("headline", profile.headline), ("summary", profile.summary)) if not present]
 
-def format_data_for_gpt(profile_data):
-    try:
-        # Extract the profile image URL safely
-        profile_image_url = safe_get_value(profile_data, 'profilePicture', '')
-
-        # Personal Information with safe retrieval
-        firstName = safe_get_value(profile_data, 'firstName', 'No first name')
-        lastName = safe_get_value(profile_data, 'lastName', 'No last name')
-        fullName = f"{firstName} {lastName}"
-        headline = safe_get_value(profile_data, 'headline', 'No headline provided')
-        summary = safe_get_value(profile_data, 'summary', 'No summary provided')
-        location = safe_get_value(profile_data.get('geo', {}), 'full', 'No location provided')
-
-        formatted_text = f"Name: {fullName}\nHeadline: {headline}\nLocation: {location}\nSummary: {summary}\n"
-
-        # Professional Experience
-        formatted_text += "Experience:\n"
-        for position in safe_get_list(profile_data, 'position'):
-            company = position.get('companyName', 'No company name')
-            title = position.get('title', 'No title')
-            jobLocation = position.get('location', 'No location')
-            jobDescription = position.get('description', 'No description').replace('\n', ' ')
-            formatted_text += f"- {title} at {company}, {jobLocation}. {jobDescription}\n"
+        if profile.summary:
+            add(0, 0, "Summary:", profile.summary)
+
+        # Professional Experience, most recent first
+        if profile.positions:
+            add(1, 1, "Experience:")
+            for i, position in enumerate(_by_recency(profile.positions)):
+                role = " at ".join(filter(None, [position.title, position.company])) or "Role"
+                location = f", {position.location}." if position.location else "."
+                add(2 + i / 1000, 2 + i, f"- {role}{location}", position.description)
+        else:
+            missing.append("experience")
 
         # Education
-        formatted_text += "Education:\n"
-        for education in safe_get_list(profile_data, 'educations'):
-            school = education.get('schoolName', 'No school name')
-            degree = education.get('degree', 'No degree')
-            field = education.get('fieldOfStudy', 'No field of study')
-            grade = education.get('grade', 'No grade')
-            eduDescription = education.get('description', 'No description').replace('\n', ' ')
-            formatted_text += f"- {degree} in {field} from {school}, Grade: {grade}. {eduDescription}\n"
-
-        # Skills
-        formatted_text += "Skills:\n"
-        for skill in safe_get_list(profile_data, 'skills'):
-            skillName = skill.get('name', 'No skill name')
-            formatted_text += f"- {skillName}\n"
-
-        # Languages
-        formatted_text += "Languages:\n"
-        languages = safe_get_list(profile_data, 'languages')
-        if languages:
-            for language in languages:
-                langName = language.get('name', 'No language name')
-                proficiency = language.get('proficiency', 'No proficiency level')
-                formatted_text += f"- {langName} ({proficiency})\n"
+        if profile.educations:
+            add(3, 50, "Education:")
+            for i, education in enumerate(profile.educations):
+                text = " in ".join(filter(None, [education.degree, education.field]))
+                text = " from ".join(filter(None, [text, education.school]))
+                text += f", Grade: {education.grade}." if education.grade else "."
+                add(4 + i / 1000, 51 + i, f"- {text}", education.description)
         else:
-            formatted_text += "- No languages provided\n"
+            missing.append("education")
+
+        # Skills, languages and certifications as single compact lines
+        if profile.skills:
+            add(5, 80, "Skills: " + ", ".join(profile.skills))
+        else:
+            missing.append("skills")
+
+        if profile.languages:
+            languages = [f"{language.name} ({language.proficiency})" if language.proficiency else language.name
+                         for language in profile.languages]
+            add(6, 85, "Languages: " + ", ".join(languages))
+
+        if profile.certifications:
+            add(7, 90, "Certifications: " + ", ".join(profile.certifications))
 
-        # Certifications
-        formatted_text += "Certifications:\n"
-        for certification in safe_get_list(profile_data, 'certifications'):
-            certName = certification.get('name', 'No certification name')
-            formatted_text += f"- {certName}\n"
+        if missing:
+            header.append("Missing: " + ", ".join(missing))
+        header = [line for line in header if line]
 
-        return formatted_text, profile_image_url
+        truncated = _fit_to_budget(header, entries, token_budget)
+
+        lines = header[:]
+        for _, _, text, detail in sorted(entries, key=lambda entry: entry[0]):
+            lines.append(f"{text} {detail}" if detail else text)
+        formatted_text = "\n".join(lines) + "\n"
+        return FormattedProfile(formatted_text, profile.picture_url, estimate_tokens(formatted_text), truncated)
 
     except Exception as e:
         logging.exception("An error occurred during data formatting.")
-        return None, None
+        return None
+
+def _by_recency(positions):
+    """Sort positions newest first by start date, keeping the API order when dates are missing."""
+    if all(position.start for position in positions):
+        return sorted(positions, key=lambda position: position.start, reverse=True)
+    return positions
+
+def _fit_to_budget(header, entries, token_budget):
+    """Shorten details and drop entries in place until everything fits. Returns True if anything changed."""
+    if token_budget is None:
+        return False
+    # One extra token per line for the newline
+    used = sum(estimate_tokens(line) + 1 for line in header) + sum(estimate_tokens(entry[2]) + 1 for entry in entries)
+    truncated = False
+
+    # Drop whole entries, least important first, until the bare entries fit
+    for entry in sorted(entries, key=lambda entry: entry[1], reverse=True):
+        if used <= token_budget:
+            break
+        entries.remove(entry)
+        used -= estimate_tokens(entry[2]) + 1
+        truncated = True
+
+    # Hand the remaining budget to the details in priority order. Each detail may take at most half of
+    # what is left (the last one all of it), so one long summary can't starve the recent roles.
+    with_details = [entry for entry in sorted(entries, key=lambda entry: entry[1]) if entry[3]]
+    for i, entry in enumerate(with_details):
+        remaining = token_budget - used - 1
+        allowance = remaining if i == len(with_details) - 1 else remaining // 2
+        detail = truncate_to_tokens(entry[3], allowance) if allowance > 8 else ""
+        if detail != entry[3]:
+            truncated = True
+        entry[3] = detail
+        used += estimate_tokens(detail) + 1 if detail else 0
+    return truncated
 
 
 if __name__ == "__main__":
@@ -1,56 +1,145 @@
+import glob
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from openai import OpenAI
+from openai import NotFoundError
+
+from openai_pool import get_openai_client
+
+from tool_dispatch import handle_tool_calls
 
 load_dotenv() 
 
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+# Path to the directory containing the PDFs
+PDF_DIRECTORY = "knowledge"
+USE_HOSTED_RETRIEVAL = os.getenv("USE_HOSTED_RETRIEVAL", "").lower() in ("1", "true", "yes")
+UPLOAD_WORKERS = 6
+
+# Remote file and assistant IDs from previous runs, so redeploys only change what changed
+MANIFEST_PATH = os.getenv("ASSISTANT_MANIFEST", ".assistant_manifest.json")
 
 # Define the function for creating the Assistant
 def create_linkedin_profile_analyzer():
-    # List of PDF files
-    pdf_files = [
-        "file1.pdf",
-        "file2.pdf",
-        "file3.pdf",
-        "file4.pdf",
-        "file5.pdf",
-        "file6.pdf"
-    ]
-
-    # Path to the directory containing the PDFs
-    pdf_directory = "knowledge"  # Adjust the path as necessary
-
-    # Upload documents for Retrieval
+    """
+    Create the Assistant, or update the one created before in place. Uploaded files and the assistant are
+    tracked in a local manifest (file content hash -> file ID, config hash -> assistant ID), so only
+    changed files are uploaded and an unchanged assistant isn't touched at all.
+    """
+    client = get_openai_client()
+    manifest = load_manifest()
+
+    # Knowledge base passages are retrieved locally (see knowledge_index.py) and sent with each
+    # analysis request. Set USE_HOSTED_RETRIEVAL=1 to also upload the PDFs for OpenAI's retrieval tool.
+    tools = [{"type": "function", "function": function_json}]
     file_ids = []
-    for pdf_file in pdf_files:
-        file_path = os.path.join(pdf_directory, pdf_file)
-        with open(file_path, "rb") as file_data:
-            file = client.files.create(file=file_data, purpose="assistants")
-            file_ids.append(file.id)
-
-    # Create the Assistant with necessary tools
-    assistant = client.beta.assistants.create(
-        name="LinkedIn Profile Analyzer",
-        instructions = (
+    stale_file_ids = []
+    if USE_HOSTED_RETRIEVAL:
+        # Upload documents for Retrieval
+        manifest["files"], stale_file_ids = sync_files(manifest["files"])
+        file_ids = [entry["file_id"] for entry in manifest["files"].values()]
+        tools.insert(0, {"type": "retrieval"})
+    else:
+        stale_file_ids = [entry["file_id"] for entry in manifest["files"].values()]
+        manifest["files"] = {}
+
+    config = {
+        "name": "LinkedIn Profile Analyzer",
+        "instructions": (
             "You are an expert in LinkedIn profile optimization, tasked with providing a comprehensive analysis "
             "of a user's LinkedIn profile, analyze it thoroughly. Be helpful, "
             "and maintain a casual, approachable yet professional tone. Remember to address the user directly and use the first person.\n"
             "- analyze_profile_picture, when the image url of the profile is given."
         ),
-        model="gpt-4-turbo-preview",
-        tools=[
-            {"type": "retrieval", "file_ids": file_ids},
-            {"type": "function", "function": function_json}
-        ]
-    )
+        "model": "gpt-4-turbo-preview",
+        "tools": tools,
+        "file_ids": file_ids,
+    }
+    config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    assistant_id = manifest["assistant"].get("id") or os.getenv("ASSISTANT_ID")
+    assistant = None
+    if assistant_id:
+        try:
+            assistant = client.beta.assistants.retrieve(assistant_id)
+        except NotFoundError:
+            print(f"Assistant {assistant_id} no longer exists, creating a new one.")
+
+    if assistant is None:
+        # Create the Assistant with necessary tools
+        assistant = client.beta.assistants.create(**config)
+        print(f"Created assistant {assistant.id}")
+    elif manifest["assistant"].get("config_hash") != config_hash:
+        assistant = client.beta.assistants.update(assistant.id, **config)
+        print(f"Updated assistant {assistant.id}")
+    else:
+        print(f"Assistant {assistant.id} is up to date")
+
+    manifest["assistant"] = {"id": assistant.id, "config_hash": config_hash}
+    save_manifest(manifest)
+
+    # Only delete replaced files once the assistant no longer references them
+    for file_id in stale_file_ids:
+        try:
+            client.files.delete(file_id)
+        except NotFoundError:
+            pass
     return assistant
 
+def sync_files(tracked_files):
+    """
+    Upload the knowledge PDFs whose content changed since the last run, in parallel.
+    Returns the new {file name: {"sha256", "file_id"}} mapping and the IDs of remote files no longer needed.
+    """
+    current = {
+        os.path.basename(path): file_hash(path)
+        for path in sorted(glob.glob(os.path.join(PDF_DIRECTORY, "*.pdf")))
+    }
+    files = {name: tracked_files[name] for name, digest in current.items()
+             if tracked_files.get(name, {}).get("sha256") == digest}
+    stale_file_ids = [entry["file_id"] for name, entry in tracked_files.items() if name not in files]
+
+    client = get_openai_client()
+
+    def upload(name):
+        with open(os.path.join(PDF_DIRECTORY, name), "rb") as file_data:
+            return client.files.create(file=file_data, purpose="assistants").id
+
+    to_upload = [name for name in current if name not in files]
+    if to_upload:
+        print(f"Uploading {len(to_upload)} changed file(s): {', '.join(to_upload)}")
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            for name, file_id in zip(to_upload, pool.map(upload, to_upload)):
+                files[name] = {"sha256": current[name], "file_id": file_id}
+    return dict(sorted(files.items())), stale_file_ids
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    else:
+        manifest = {}
+    manifest.setdefault("files", {})
+    manifest.setdefault("assistant", {})
+    return manifest
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
+
 # Define the function to create thread and run
 def create_thread_and_run(assistant_id, user_message):
+    client = get_openai_client()
     thread = client.beta.threads.create()
     client.beta.threads.messages.create(
         thread_id=thread.id, role="user", content=user_message
@@ -75,64 +164,14 @@ function_json = {
 
 
 def handle_custom_function(run):
-    if run.status == 'requires_action' and run.required_action.type == 'submit_tool_outputs':
-        for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-            if tool_call.function.name == "analyze_profile_picture":
-                image_url = json.loads(tool_call.function.arguments)["image_url"]
-                
-                # Call GPT-4 Vision API to analyze the image
-                vision_response = client.chat.completions.create(
-                    model='gpt-4-vision-preview',
-                    messages=[
-                        {
-                        "role": "user",
-                        "content": [
-                            {
-                            "type": "text", 
-                            "text": (
-                                        "Analyze this LinkedIn profile picture. Provide an analysis focusing on its "
-                                        "appropriateness and effectiveness for a LinkedIn profile. Consider the following aspects:\n\n"
-                                        "1. Presentation: Evaluate the subject's attire and grooming. Does it align with professional standards suitable for "
-                                        "their industry or field?\n"
-                                        "2. Expression and Body Language: Assess the subject's facial expression and body language. Does it project confidence, "
-                                        "approachability, and professionalism?\n"
-                                        "3. Composition and Setting: Comment on the composition of the photograph, including the background. Is it distraction-free "
-                                        "and does it enhance the subject's professional image?\n"
-                                        "4. Quality and Lighting: Evaluate the quality of the photograph, including lighting and clarity. Does the image quality "
-                                        "uphold professional standards?\n\n"
-                                        "Provide recommendations for improvement if necessary, highlighting aspects that could enhance the subject's professional "
-                                        "portrayal on LinkedIn."
-                                    )
-                            },
-                            {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url,
-                            },
-                            },
-                        ],
-                        }
-                    ],
-                    max_tokens=400
-                )
-
-
-                # Submit the output back to the Assistant
-                client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=run.thread_id,
-                    run_id=run.id,
-                    tool_outputs=[
-                        {
-                            'tool_call_id': tool_call.id,
-                            'output': vision_response.choices[0].message.content
-                        }
-                    ]
-                )
+    # Run all pending tool calls concurrently and submit their outputs in one batch
+    return handle_tool_calls(get_openai_client(), run)
 
 
 # Main function to create the assistant
 def main():
     assistant = create_linkedin_profile_analyzer()
+    print(f"Set ASSISTANT_ID={assistant.id} in your .env file to use it in the app.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+from openai import OpenAI
+
+import http_client
+from rate_limit import get_governor
+
+# Clients kept alive at once, and how long an unused client is kept
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', 64))
+OPENAI_POOL_IDLE_TTL = int(os.getenv('OPENAI_POOL_IDLE_TTL', 1800))
+
+OPENAI_TIMEOUT = httpx.Timeout(
+    connect=float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5)),
+    read=float(os.getenv('OPENAI_READ_TIMEOUT', 120)),
+    write=30.0,
+    pool=30.0,
+)
+OPENAI_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=60)
+
+# Tokens charged against the TPM budget when a run is created; runs report their usage only at the end
+OPENAI_RUN_TOKEN_ESTIMATE = int(os.getenv('OPENAI_RUN_TOKEN_ESTIMATE', 4000))
+# Tokens GPT-4 Vision charges for a low-detail image
+LOW_DETAIL_IMAGE_TOKENS = 85
+
+
+class OpenAIClientPool:
+    """
+    One long-lived OpenAI client per API key, kept in LRU order. Clients are thread safe and all share a
+    single httpx connection pool (the key is sent per request), so keep-alive connections to the API are
+    reused across users. Evicting a client just drops it; the shared connections stay open.
+
+    Every request first queues for the rate-limit governor of its API key (see rate_limit.py), and every
+    response feeds the key's x-ratelimit-* headers back into it. Queueing never fails: load is shed before
+    work starts, by admit_analysis.
+    """
+
+    def __init__(self, max_clients=OPENAI_POOL_SIZE, idle_ttl=OPENAI_POOL_IDLE_TTL):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self._http_client = httpx.Client(
+            timeout=OPENAI_TIMEOUT,
+            limits=OPENAI_LIMITS,
+            event_hooks={"request": [_govern_request], "response": [_record_rate_limits]},
+        )
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        """Return the client for `api_key`, creating it on first use."""
+        if not api_key:
+            raise ValueError("An OpenAI API key is required")
+        key = key_fingerprint(api_key)
+        now = time.time()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = [OpenAI(api_key=api_key, http_client=self._http_client), now]
+                self._clients[key] = entry
+            entry[1] = now
+            self._clients.move_to_end(key)
+            self._evict(now)
+            return entry[0]
+
+    def _evict(self, now):
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+        # The least recently used clients are at the front
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def __len__(self):
+        return len(self._clients)
+
+
+def _governor_for(request):
+    api_key = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return get_governor(f"openai:{key_fingerprint(api_key)}")
+
+
+def _govern_request(request):
+    # Requests of work already admitted wait their turn rather than being shed halfway through an analysis.
+    # This must not raise: the SDK would take any error here for a connection failure, retry the request
+    # and finally report APIConnectionError.
+    _governor_for(request).acquire(tokens=estimate_request_tokens(request), max_wait=math.inf)
+
+
+def _record_rate_limits(response):
+    governor = _governor_for(response.request)
+    governor.update_from_headers(response.headers)
+    if response.status_code == 429:
+        governor.penalize(http_client.retry_after_seconds(response) or 1.0)
+
+
+def estimate_request_tokens(request):
+    """Rough TPM cost of an API request: prompt text plus max_tokens for completions, a flat estimate for runs."""
+    if request.method != "POST":
+        return 0
+    path = request.url.path
+    if path.endswith("/runs"):
+        return OPENAI_RUN_TOKEN_ESTIMATE
+    if not path.endswith("/chat/completions"):
+        return 0
+    try:
+        body = json.loads(request.content)
+    except (ValueError, httpx.RequestNotRead):
+        return 0
+    chars, images = 0, 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        for part in content if isinstance(content, list) else [{"type": "text", "text": content or ""}]:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(part.get("text") or "")
+    return chars // 4 + images * LOW_DETAIL_IMAGE_TOKENS + (body.get("max_tokens") or 0)
+
+
+def key_fingerprint(api_key):
+    """Identify an API key (e.g. in pool or job keys) without keeping the key itself."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_openai_client(api_key=None):
+    """Return the shared client for `api_key` (default: OPENAI_API_KEY from the environment)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OpenAIClientPool()
+    return _pool.get(api_key or os.getenv("OPENAI_API_KEY"))
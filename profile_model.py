@@ -0,0 +1,142 @@
+"""
+Typed profile model, parsed once from the RapidAPI response.
+
+All text is whitespace-normalized while parsing, so prompt building, caching and section diffing work on
+plain attributes instead of walking the raw response again. Profiles are stored in caches as compact
+positional records (see Profile.to_record), which are JSON serializable.
+"""
+from dataclasses import dataclass
+
+# Bump when the record layout changes; records of other versions are treated as absent
+RECORD_VERSION = 1
+
+
+def clean_text(value):
+    """Collapse all whitespace, including newlines, into single spaces."""
+    return " ".join(str(value).split()) if value else ""
+
+
+def _date(value):
+    """A RapidAPI {"year", "month"} date as a (year, month) tuple, or None without a year."""
+    if not value or not value.get('year'):
+        return None
+    return (value['year'], value.get('month') or 0)
+
+
+def _items(data, key):
+    return data.get(key) or ()
+
+
+@dataclass(frozen=True, slots=True)
+class Position:
+    title: str
+    company: str
+    location: str
+    description: str
+    start: tuple | None
+    end: tuple | None
+
+    @classmethod
+    def from_api(cls, data):
+        get = data.get
+        return cls(clean_text(get('title')), clean_text(get('companyName')), clean_text(get('location')),
+                   clean_text(get('description')), _date(get('start')), _date(get('end')))
+
+
+@dataclass(frozen=True, slots=True)
+class Education:
+    school: str
+    degree: str
+    field: str
+    grade: str
+    description: str
+
+    @classmethod
+    def from_api(cls, data):
+        get = data.get
+        return cls(clean_text(get('schoolName')), clean_text(get('degree')), clean_text(get('fieldOfStudy')),
+                   clean_text(get('grade')), clean_text(get('description')))
+
+
+@dataclass(frozen=True, slots=True)
+class Language:
+    name: str
+    proficiency: str
+
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    username: str
+    first_name: str
+    last_name: str
+    headline: str
+    summary: str
+    location: str
+    picture_url: str
+    positions: tuple
+    educations: tuple
+    skills: tuple
+    languages: tuple
+    certifications: tuple
+
+    @property
+    def full_name(self):
+        return " ".join(filter(None, [self.first_name, self.last_name]))
+
+    @classmethod
+    def from_api(cls, data):
+        """Parse a RapidAPI profile response. Entries without a name are dropped."""
+        get = data.get
+        languages = []
+        for language in _items(data, 'languages'):
+            name = clean_text(language.get('name'))
+            if name:
+                languages.append(Language(name, clean_text(language.get('proficiency'))))
+        return cls(
+            username=clean_text(get('username')),
+            first_name=clean_text(get('firstName')),
+            last_name=clean_text(get('lastName')),
+            headline=clean_text(get('headline')),
+            summary=clean_text(get('summary')),
+            location=clean_text((get('geo') or {}).get('full')),
+            picture_url=get('profilePicture') or "",
+            positions=tuple(Position.from_api(position) for position in _items(data, 'position')),
+            educations=tuple(Education.from_api(education) for education in _items(data, 'educations')),
+            skills=tuple(filter(None, (clean_text(skill.get('name')) for skill in _items(data, 'skills')))),
+            languages=tuple(languages),
+            certifications=tuple(filter(None, (clean_text(item.get('name')) for item in _items(data, 'certifications')))),
+        )
+
+    def to_record(self):
+        """A compact, JSON serializable list of the field values, for caches."""
+        return [
+            RECORD_VERSION, self.username, self.first_name, self.last_name, self.headline, self.summary,
+            self.location, self.picture_url,
+            [[p.title, p.company, p.location, p.description, p.start, p.end] for p in self.positions],
+            [[e.school, e.degree, e.field, e.grade, e.description] for e in self.educations],
+            list(self.skills),
+            [[language.name, language.proficiency] for language in self.languages],
+            list(self.certifications),
+        ]
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a Profile from to_record output. Returns None for records of another version."""
+        if not record or record[0] != RECORD_VERSION:
+            return None
+        _, username, first_name, last_name, headline, summary, location, picture_url, positions, educations, \
+            skills, languages, certifications = record
+        return cls(
+            username, first_name, last_name, headline, summary, location, picture_url,
+            tuple(Position(title, company, place, description, _tuple(start), _tuple(end))
+                  for title, company, place, description, start, end in positions),
+            tuple(Education(*education) for education in educations),
+            tuple(skills),
+            tuple(Language(*language) for language in languages),
+            tuple(certifications),
+        )
+
+
+def _tuple(value):
+    # JSON turns tuples into lists
+    return tuple(value) if value is not None else None
@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from PIL import Image, ImageOps
+
+import http_client
+from cache import MemoryCache, make_cache
+
+# Downloaded profile pictures, keyed by URL
+picture_cache = MemoryCache(max_entries=128, ttl=3600)
+
+# The picture URL can come from a tool call, i.e. from the model reading user-controlled profile text, so
+# downloads are limited to http(s), a maximum size, and images Pillow may decode without a memory blowup
+PICTURE_MAX_BYTES = int(os.getenv('PICTURE_MAX_BYTES', 10 * 1024 * 1024))
+PICTURE_MAX_PIXELS = int(os.getenv('PICTURE_MAX_PIXELS', 40_000_000))
+Image.MAX_IMAGE_PIXELS = PICTURE_MAX_PIXELS
+
+# What GPT-4 Vision gets: in "low" detail mode the model looks at a 512x512 version of the image at a
+# fixed 85 tokens, which is plenty for judging a headshot. "high" sends a larger image for tiled analysis.
+VISION_IMAGE_DETAIL = os.getenv('VISION_IMAGE_DETAIL', 'low')
+VISION_IMAGE_MAX_SIDE = int(os.getenv('VISION_IMAGE_MAX_SIDE', 512 if VISION_IMAGE_DETAIL == 'low' else 1024))
+VISION_IMAGE_QUALITY = int(os.getenv('VISION_IMAGE_QUALITY', 85))
+
+# Processed pictures (base64 data URLs), keyed by URL and processing settings
+processed_picture_cache = make_cache(
+    "pictures",
+    backend=os.getenv('PICTURE_CACHE_BACKEND'),
+    path=os.getenv('PICTURE_CACHE_PATH'),
+    ttl=int(os.getenv('PICTURE_CACHE_TTL', 24 * 3600)),
+    max_entries=int(os.getenv('PICTURE_CACHE_SIZE', 512)),
+)
+
+# A picture ready for the vision model: the data URL to send, the detail mode, and a hash of the
+# processed bytes (what the model actually sees, so it can key caches)
+ProcessedPicture = namedtuple("ProcessedPicture", ["data_url", "detail", "digest"])
+
+
+def fetch_profile_picture(image_url):
+    """
+    Download a profile picture once and keep the bytes in memory. Returns None on failure, for URLs that
+    aren't http(s), and for pictures over PICTURE_MAX_BYTES.
+    """
+    if not image_url:
+        return None
+    if urlparse(image_url).scheme not in ("http", "https"):
+        logging.warning(f"Not downloading profile picture from {image_url}: only http(s) URLs are allowed")
+        return None
+    entry = picture_cache.get(image_url)
+    if entry is not None:
+        return entry.value
+
+    try:
+        # Redirects are followed by httpx only to other http(s) URLs
+        content = http_client.download(image_url, PICTURE_MAX_BYTES, max_retries=1, follow_redirects=True)
+    except Exception:
+        logging.exception(f"Failed to download profile picture from {image_url}")
+        return None
+    picture_cache.set(image_url, content)
+    return content
+
+
+def downscale_picture(image_bytes, max_side=VISION_IMAGE_MAX_SIDE, quality=VISION_IMAGE_QUALITY):
+    """
+    Re-encode a picture as a JPEG no larger than max_side x max_side (aspect ratio kept, never upscaled),
+    applying the EXIF orientation and dropping all metadata.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # Pillow only warns up to twice MAX_IMAGE_PIXELS; refuse anything over it before decoding
+        if image.width * image.height > Image.MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(f"Picture is {image.width}x{image.height} pixels, over the limit")
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            # Flatten transparency onto white rather than black
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def prepare_profile_picture(image_url, max_side=VISION_IMAGE_MAX_SIDE, detail=VISION_IMAGE_DETAIL):
+    """
+    Download and downscale a profile picture for the vision model, caching the result, so the model never
+    has to fetch the full-resolution image from LinkedIn's CDN. Returns a ProcessedPicture, or None if the
+    picture can't be downloaded or decoded.
+    """
+    if not image_url:
+        return None
+    cache_key = f"{image_url}|{max_side}|{VISION_IMAGE_QUALITY}"
+    entry = processed_picture_cache.get(cache_key)
+    if entry is not None:
+        return ProcessedPicture(entry.value["data_url"], detail, entry.value["digest"])
+
+    image_bytes = fetch_profile_picture(image_url)
+    if not image_bytes:
+        return None
+    try:
+        processed = downscale_picture(image_bytes, max_side)
+    except Exception:
+        logging.exception(f"Failed to process profile picture from {image_url}")
+        return None
+
+    data_url = "data:image/jpeg;base64," + base64.b64encode(processed).decode()
+    digest = hashlib.sha256(processed).hexdigest()
+    processed_picture_cache.set(cache_key, {"data_url": data_url, "digest": digest})
+    return ProcessedPicture(data_url, detail, digest)
@@ -0,0 +1,116 @@
+"""
+Per-section view of a profile for differential re-analysis.
+
+A profile is split into sections (picture, headline, summary, each position, each education entry, skills),
+each with a stable key and a digest of its content. The analysis report is written with one heading per
+section, so it can be split back into per-section assessments, and a later re-analysis only needs to send
+the sections whose digest changed.
+"""
+import hashlib
+import re
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from linkedin_scraper import truncate_to_tokens
+
+# `key` identifies the section across scrapes, `title` is its heading in the report
+Section = namedtuple("Section", ["key", "title", "text", "digest"])
+
+OVERALL_KEY = "overall"
+OVERALL_TITLE = "Overall Quality Evaluation and Potential"
+
+# Longest section text sent in a differential request, in estimated tokens
+SECTION_TOKEN_LIMIT = 600
+
+
+def _section(key, title, text):
+    digest = hashlib.sha256(f"{title}\n{text}".encode()).hexdigest()[:16]
+    return Section(key, title, text, digest)
+
+
+def _short_hash(*parts):
+    return hashlib.sha1("|".join(parts).lower().encode()).hexdigest()[:8]
+
+
+def _date(value):
+    return f"{value[1]}/{value[0]}" if value else ""
+
+
+def profile_sections(profile, image_url=None):
+    """Split a Profile into Sections, in report order. Headline, summary and skills are always present."""
+    sections = []
+    if image_url:
+        # LinkedIn picture URLs carry a changing signature in the query; the path identifies the image
+        sections.append(_section("picture", "Profile Picture", urlparse(image_url).path))
+    sections.append(_section("headline", "Headline", profile.headline or "(empty)"))
+    sections.append(_section("summary", "Summary", profile.summary or "(empty)"))
+
+    titles = set()
+    for position in profile.positions:
+        heading = "Experience: " + (" at ".join(filter(None, [position.title, position.company])) or "Role")
+        # Two roles with the same title at the same company still need distinct headings
+        while heading in titles:
+            heading += " (continued)"
+        titles.add(heading)
+        dates = " - ".join(filter(None, [_date(position.start), _date(position.end) or "present"]))
+        text = " | ".join(filter(None, [position.location, dates, position.description]))
+        key = "position:" + _short_hash(position.company, position.title, _date(position.start))
+        sections.append(_section(key, heading, text))
+
+    for education in profile.educations:
+        school = education.school or "School"
+        heading = f"Education: {school}"
+        while heading in titles:
+            heading += " (continued)"
+        titles.add(heading)
+        degree = " in ".join(filter(None, [education.degree, education.field]))
+        text = " | ".join(filter(None, [degree, education.grade, education.description]))
+        key = "education:" + _short_hash(school, degree)
+        sections.append(_section(key, heading, text))
+
+    languages = [language.name for language in profile.languages]
+    text = "; ".join(filter(None, [
+        ", ".join(profile.skills),
+        "Languages: " + ", ".join(languages) if languages else "",
+        "Certifications: " + ", ".join(profile.certifications) if profile.certifications else "",
+    ]))
+    sections.append(_section("skills", "Skills", text or "(empty)"))
+    return sections
+
+
+def section_headings(sections):
+    """The headings a report must use, in order, ending with the overall evaluation."""
+    return [section.title for section in sections] + [OVERALL_TITLE]
+
+
+def format_sections(sections):
+    """Sections as prompt text, each shortened to SECTION_TOKEN_LIMIT."""
+    return "\n".join(f"- {section.title}: {truncate_to_tokens(section.text, SECTION_TOKEN_LIMIT)}" for section in sections)
+
+
+def split_report(report, sections):
+    """
+    Split a report written with `### <section title>` headings into (intro, {section key: assessment}).
+    Text under a heading that matches no section stays with the section before it.
+    """
+    keys = {section.title.lower(): section.key for section in sections}
+    keys[OVERALL_TITLE.lower()] = OVERALL_KEY
+    intro, assessments, current = [], {}, None
+    for line in report.splitlines():
+        match = re.match(r"#{2,4}\s+(?:\d+\.\s*)?\**(.+?)\**\s*:?\s*$", line)
+        key = keys.get(match.group(1).strip().lower()) if match else None
+        if key:
+            current = key
+            assessments[current] = []
+            continue
+        (assessments[current] if current else intro).append(line)
+    return "\n".join(intro).strip(), {key: "\n".join(lines).strip() for key, lines in assessments.items()}
+
+
+def merge_report(intro, sections, assessments):
+    """Assemble a full report from per-section assessments, in section order."""
+    parts = [intro] if intro else []
+    for key, title in [(section.key, section.title) for section in sections] + [(OVERALL_KEY, OVERALL_TITLE)]:
+        if assessments.get(key):
+            parts.append(f"### {title}\n{assessments[key]}")
+    return "\n\n".join(parts)
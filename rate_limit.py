@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import metrics
+
+
+# Default budgets per upstream. OpenAI budgets are per API key and are replaced by the limits the API
+# reports in its x-ratelimit-* response headers.
+RAPIDAPI_RPM = float(os.getenv('RAPIDAPI_RPM', 60))
+OPENAI_RPM = float(os.getenv('OPENAI_RPM', 500))
+OPENAI_TPM = float(os.getenv('OPENAI_TPM', 300000))
+# Longest a request may queue; requests that would wait longer are rejected up front
+GOVERNOR_MAX_WAIT = float(os.getenv('GOVERNOR_MAX_WAIT', 30))
+# Processes sharing the same quotas (e.g. the workers of service.py); each one governs an equal share
+GOVERNOR_PROCESSES = max(int(os.getenv('GOVERNOR_PROCESSES', 1)), 1)
+
+# The user a request is made for, used to queue requests fairly across users
+current_user = contextvars.ContextVar("current_user", default="default")
+
+
+class OverloadedError(RuntimeError):
+    """An upstream is at its quota and the request can't be served within the allowed wait."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is at its rate limit, please try again in {math.ceil(retry_after)}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+@contextmanager
+def acting_as(user):
+    """Attribute upstream requests made inside the block (in this context) to `user`."""
+    token = current_user.set(user or "default")
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+class _Bucket:
+    """Token bucket state for one budget (requests or tokens per minute). Not locked; Governor locks."""
+
+    def __init__(self, per_minute):
+        # Highest budget per minute, whatever the rate-limit headers report (see Governor.configure)
+        self.ceiling = None
+        self.set_rate(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def set_rate(self, per_minute):
+        if self.ceiling:
+            per_minute = min(per_minute, self.ceiling)
+        self.rate = per_minute / 60.0
+        # Allow bursts of ten seconds' worth of budget
+        self.capacity = max(1.0, per_minute / 6.0)
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount):
+        """Seconds until `amount` is available, assuming nothing else is taken first."""
+        # Requests larger than the whole bucket go through once it is full
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.rate
+
+
+class Governor:
+    """
+    Token-bucket governor for one upstream, with a requests-per-minute budget and an optional tokens-per-minute
+    budget. Callers wait in a fair queue: each user's next request is ordered by start-time fair queuing, so a
+    user with many requests queued can't starve users with one. The budgets are corrected from the rate-limit
+    headers of responses (`update_from_headers`), and a 429 pauses the upstream (`penalize`).
+
+    `admit` is the admission check for new work: it rejects with OverloadedError when the queue is already
+    longer than `max_wait`, so load is shed before anything is sent instead of timing out later.
+    """
+
+    def __init__(self, name, rpm, tpm=None, max_wait=GOVERNOR_MAX_WAIT):
+        self.name = name
+        self.max_wait = max_wait
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm) if tpm else None
+        self._paused_until = 0.0
+        self._waiting = []
+        self._user_finish = {}
+        self._virtual_time = 0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, user=None, tokens=0, max_wait=None):
+        """Block until the request may be sent. Raises OverloadedError if that would take over `max_wait`."""
+        ticket = self._enqueue(user, tokens, max_wait)
+        try:
+            with self._cond:
+                while True:
+                    wait = self._poll(ticket)
+                    if wait is None:
+                        return
+                    self._cond.wait(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    async def acquire_async(self, user=None, tokens=0, max_wait=None):
+        ticket = self._enqueue(user, tokens, max_wait)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket)
+                if wait is None:
+                    return
+                # Other tickets are served by other threads and loops too, so don't sleep long without rechecking
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            # E.g. the task was cancelled: a ticket left behind would count against every later request
+            self._abandon(ticket)
+            raise
+
+    def configure(self, rpm=None, tpm=None, max_wait=None):
+        """
+        Set the budgets to `rpm` requests and `tpm` tokens per minute, and keep them there even when the
+        rate-limit headers report higher limits (e.g. to leave quota to other clients). `max_wait` changes
+        how long requests may queue; math.inf never sheds.
+        """
+        with self._cond:
+            for bucket, per_minute in ((self.requests, rpm), (self.tokens, tpm)):
+                if bucket is not None and per_minute:
+                    bucket.ceiling = per_minute
+                    bucket.set_rate(per_minute)
+                    bucket.level = min(bucket.level, bucket.capacity)
+            if max_wait is not None:
+                self.max_wait = max_wait
+            self._cond.notify_all()
+
+    def estimate_wait(self, tokens=0):
+        """Seconds a new request would queue behind the requests already waiting."""
+        with self._cond:
+            return self._estimate_wait(tokens, time.monotonic())
+
+    def admit(self, tokens=0):
+        """Reject new work with OverloadedError if it couldn't start within `max_wait`."""
+        wait = self.estimate_wait(tokens)
+        if wait > self.max_wait:
+            metrics.incr("governor_shed_total", upstream=self.name)
+            raise OverloadedError(self.name, wait)
+
+    def update_from_headers(self, headers):
+        """
+        Apply rate-limit response headers: OpenAI's x-ratelimit-{limit,remaining,reset}-{requests,tokens}
+        and RapidAPI's x-ratelimit-requests-{remaining,reset}. Limits reset the budgets; the remaining
+        counts cap what the bucket may still hand out, and zero remaining pauses until the reset.
+        """
+        now = time.monotonic()
+        with self._cond:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                if bucket is None:
+                    continue
+                limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+                if limit:
+                    bucket.set_rate(limit / GOVERNOR_PROCESSES)
+                remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}", f"x-ratelimit-{kind}-remaining")
+                if remaining is None:
+                    continue
+                bucket.refill(now)
+                bucket.level = min(bucket.level, remaining)
+                if remaining <= 0:
+                    reset = _header_duration(headers, f"x-ratelimit-reset-{kind}", f"x-ratelimit-{kind}-reset")
+                    self._paused_until = max(self._paused_until, now + (reset if reset is not None else 1.0))
+            self._cond.notify_all()
+
+    def penalize(self, seconds):
+        """Pause the upstream, e.g. for the Retry-After of a 429."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            metrics.incr("governor_throttled_total", upstream=self.name)
+
+    def queue_length(self):
+        with self._cond:
+            return len(self._waiting)
+
+    def _enqueue(self, user, tokens, max_wait):
+        user = user or current_user.get()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._cond:
+            now = time.monotonic()
+            wait = self._estimate_wait(tokens, now)
+            if wait > max_wait:
+                metrics.incr("governor_shed_total", upstream=self.name)
+                raise OverloadedError(self.name, wait)
+            finish = max(self._user_finish.get(user, 0), self._virtual_time) + 1
+            self._user_finish[user] = finish
+            ticket = [finish, next(self._sequence), user, tokens, now]
+            self._waiting.append(ticket)
+            return ticket
+
+    def _abandon(self, ticket):
+        """Take a ticket that will never be served out of the queue."""
+        with self._cond:
+            if ticket not in self._waiting:
+                return
+            self._waiting.remove(ticket)
+            user = ticket[2]
+            if self._user_finish.get(user) == ticket[0]:
+                # The user's next request is ordered after their remaining tickets, if any
+                remaining = [other[0] for other in self._waiting if other[2] == user]
+                if remaining:
+                    self._user_finish[user] = max(remaining)
+                else:
+                    del self._user_finish[user]
+            self._cond.notify_all()
+
+    def _poll(self, ticket):
+        """Serve `ticket` if it is first in line and the budgets allow. Returns None if served, else seconds to wait."""
+        now = time.monotonic()
+        # A ticket may go as soon as the budgets cover it and every ticket ahead of it in fair order, so
+        # ordering only costs anything when the upstream is actually contended
+        ahead = [other for other in self._waiting if other < ticket]
+        wait = self._ready_in(len(ahead) + 1, sum(other[3] for other in ahead) + ticket[3], now)
+        if wait > 0:
+            return wait if not ahead else min(wait, 0.05)
+
+        self.requests.level -= 1
+        if self.tokens is not None and ticket[3]:
+            self.tokens.level -= ticket[3]
+        self._waiting.remove(ticket)
+        self._virtual_time = ticket[0]
+        if self._user_finish.get(ticket[2]) == ticket[0]:
+            del self._user_finish[ticket[2]]
+        metrics.observe("governor_wait_seconds", now - ticket[4], upstream=self.name)
+        self._cond.notify_all()
+        return None
+
+    def _ready_in(self, requests, tokens, now):
+        self.requests.refill(now)
+        wait = max(self._paused_until - now, self.requests.time_until(requests))
+        if self.tokens is not None and tokens:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.time_until(tokens))
+        return wait
+
+    def _estimate_wait(self, tokens, now):
+        # Time for the bucket to cover everything queued plus this request, at the refill rate
+        queued_tokens = sum(ticket[3] for ticket in self._waiting) + tokens
+        self.requests.refill(now)
+        wait = (len(self._waiting) + 1 - self.requests.level) / self.requests.rate
+        if self.tokens is not None and queued_tokens:
+            self.tokens.refill(now)
+            wait = max(wait, (queued_tokens - self.tokens.level) / self.tokens.rate)
+        return max(wait, self._paused_until - now, 0.0)
+
+
+def _header_number(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+
+def _header_duration(headers, *names):
+    """Parse a reset header: plain seconds (RapidAPI) or a duration like "6m0s" or "120ms" (OpenAI)."""
+    for name in names:
+        value = headers.get(name)
+        if not value:
+            continue
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+        if parts:
+            units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+            return sum(float(number) * units[unit] for number, unit in parts)
+    return None
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(name):
+    """
+    Return the process-wide governor for an upstream: "rapidapi", or "openai:<key fingerprint>" (one per
+    API key, since OpenAI quotas are per key).
+    """
+    with _governors_lock:
+        governor = _governors.get(name)
+        if governor is None:
+            if name.startswith("openai"):
+                governor = Governor(name, OPENAI_RPM / GOVERNOR_PROCESSES, OPENAI_TPM / GOVERNOR_PROCESSES)
+            else:
+                governor = Governor(name, RAPIDAPI_RPM / GOVERNOR_PROCESSES)
+            _governors[name] = governor
+            metrics.register_collector(lambda: [("governor_queue_length", {"upstream": name}, governor.queue_length())])
+        return governor
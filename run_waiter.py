@@ -0,0 +1,185 @@
+import logging
+import random
+import time
+
+import httpx
+import openai
+
+# Run statuses after which the run will not change any more
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired"}
+
+
+class RunFailedError(Exception):
+    """Raised when a run ends in a terminal status other than "completed"."""
+
+    def __init__(self, run):
+        self.run = run
+        reason = getattr(run.last_error, "message", None) if getattr(run, "last_error", None) else None
+        super().__init__(f"Run {run.id} ended with status '{run.status}'" + (f": {reason}" if reason else ""))
+
+
+class RunTimeoutError(Exception):
+    """Raised when a run does not reach a terminal status before the deadline. The run has been cancelled."""
+
+    def __init__(self, run, timeout):
+        self.run = run
+        super().__init__(f"Run {run.id} still '{run.status}' after {timeout:.0f}s")
+
+
+class RunStreamError(Exception):
+    """Raised when a run event stream ends without reporting the run it started."""
+
+
+def wait_for_run(client, thread_id, run, on_requires_action=None, timeout=300, initial_interval=0.3,
+                 max_interval=2.0, multiplier=1.5, jitter=0.2, sleep=time.sleep):
+    """
+    Poll a run until it reaches a terminal status and return the completed run.
+
+    Polling starts at `initial_interval` seconds and backs off exponentially (with +/- `jitter` relative
+    randomization) up to `max_interval`. When the run requires action, `on_requires_action(run)` is called;
+    it may return a list of tool outputs for this function to submit, or None if it submitted them itself.
+    The backoff is reset afterwards since the run usually resumes quickly.
+
+    Raises RunFailedError for failed/cancelled/expired runs and RunTimeoutError once `timeout` seconds pass,
+    after cancelling the run.
+    """
+    return _poll(client, thread_id, run, on_requires_action, timeout, set(), initial_interval, max_interval,
+                 multiplier, jitter, sleep)
+
+
+def _poll(client, thread_id, run, on_requires_action, timeout, handled_actions, initial_interval=0.3,
+          max_interval=2.0, multiplier=1.5, jitter=0.2, sleep=time.sleep):
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+
+    while True:
+        if run.status in TERMINAL_STATUSES:
+            if run.status != "completed":
+                raise RunFailedError(run)
+            return run
+
+        if run.status == "requires_action" and _action_key(run) not in handled_actions:
+            handled_actions.add(_action_key(run))
+            _handle_requires_action(client, run, on_requires_action)
+            interval = initial_interval
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _timed_out(client, thread_id, run, timeout)
+
+        delay = interval * random.uniform(1 - jitter, 1 + jitter)
+        sleep(min(delay, remaining))
+        interval = min(interval * multiplier, max_interval)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+
+
+def create_and_wait(client, thread_id, assistant_id, instructions=None, on_requires_action=None,
+                    stream=False, on_event=None, timeout=300, **wait_kwargs):
+    """
+    Start a run on a thread and wait for it to complete.
+
+    With `stream=True` the run is consumed as a server-sent event stream (when the installed openai
+    client supports it), so completion is noticed as soon as it happens instead of on the next poll.
+    Every stream event is passed to `on_event(event)`. Without streaming support this falls back to
+    polling with `wait_for_run`.
+
+    The run is cancelled and RunTimeoutError raised once `timeout` seconds pass, also while it is still
+    streaming events. RunStreamError is raised if the stream never reported the run.
+    """
+    run_kwargs = {"thread_id": thread_id, "assistant_id": assistant_id}
+    if instructions:
+        run_kwargs["instructions"] = instructions
+
+    runs = client.beta.threads.runs
+    if stream and hasattr(runs, "create_and_stream"):
+        deadline = time.monotonic() + timeout
+        run = _consume_stream(runs.create_and_stream(**run_kwargs, timeout=timeout), on_event, deadline)
+        if run is None:
+            # Don't start another run: the first one may be active on the thread
+            raise RunStreamError(f"The run stream on thread {thread_id} ended without reporting a run")
+        handled_actions = set()
+        while run.status == "requires_action":
+            if _action_key(run) in handled_actions:
+                # The submit stream reported no newer run state; these outputs were sent already
+                break
+            if time.monotonic() >= deadline:
+                raise _timed_out(client, thread_id, run, timeout)
+            handled_actions.add(_action_key(run))
+            tool_outputs = on_requires_action(run) if on_requires_action else None
+            if not tool_outputs:
+                # The handler submitted the outputs itself, continue by polling
+                break
+            remaining = max(deadline - time.monotonic(), 1)
+            run = _consume_stream(
+                runs.submit_tool_outputs_stream(
+                    thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs, timeout=remaining
+                ),
+                on_event,
+                deadline,
+            ) or run
+        if run.status not in TERMINAL_STATUSES and time.monotonic() >= deadline:
+            raise _timed_out(client, thread_id, run, timeout)
+        remaining = max(deadline - time.monotonic(), 0)
+        return _poll(client, thread_id, run, on_requires_action, remaining, handled_actions, **wait_kwargs)
+
+    run = runs.create(**run_kwargs)
+    return wait_for_run(client, thread_id, run, on_requires_action, timeout=timeout, **wait_kwargs)
+
+
+def message_text_delta(event):
+    """Return the text added by a "thread.message.delta" stream event, or "" for any other event."""
+    if event.event != "thread.message.delta":
+        return ""
+    return "".join(
+        part.text.value or ""
+        for part in event.data.delta.content or []
+        if part.type == "text" and part.text
+    )
+
+
+def _consume_stream(stream_manager, on_event, deadline):
+    """
+    Read a run event stream to the end and return the last run object seen. Once `deadline` passes (between
+    events, or as a read timeout while the stream is silent), stop early and return the run as it was last seen.
+    """
+    run = None
+    try:
+        with stream_manager as stream:
+            for event in stream:
+                if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    run = event.data
+                if on_event:
+                    on_event(event)
+                if run is not None and time.monotonic() >= deadline:
+                    break
+    except (openai.APITimeoutError, httpx.TimeoutException):
+        if run is None or time.monotonic() < deadline:
+            raise
+    return run
+
+
+def _timed_out(client, thread_id, run, timeout):
+    """Cancel a run that ran out of time and return the RunTimeoutError to raise."""
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+    except Exception:
+        # It may have finished or failed in the meantime; the timeout is reported either way
+        logging.exception(f"Failed to cancel run {run.id}")
+    return RunTimeoutError(run, timeout)
+
+
+def _handle_requires_action(client, run, on_requires_action):
+    if on_requires_action is None:
+        logging.warning(f"Run {run.id} requires action but no handler was given")
+        return
+    tool_outputs = on_requires_action(run)
+    if tool_outputs:
+        client.beta.threads.runs.submit_tool_outputs(
+            thread_id=run.thread_id, run_id=run.id, tool_outputs=tool_outputs
+        )
+
+
+def _action_key(run):
+    """Identify a required action by its tool call ids, so the same request is only handled once."""
+    calls = run.required_action.submit_tool_outputs.tool_calls if run.required_action else []
+    return run.id + ":" + ",".join(call.id for call in calls)
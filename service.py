@@ -0,0 +1,135 @@
+"""
+HTTP service exposing the analysis pipeline, for running it across several worker processes:
+
+    python service.py --workers 4 --port 8000
+    ANALYSIS_SERVICE_URL=http://127.0.0.1:8000 streamlit run app.py
+
+The workers share job state (JOB_STORE_PATH) and the profile, picture, vision and analysis caches
+through SQLite files in WAL mode, so any worker can serve any job, and a profile scraped or a picture
+analyzed by one worker is reused by all. The rate-limit governors split the upstream quotas between the
+workers (GOVERNOR_PROCESSES).
+
+Endpoints (every analysis and follow-up is billed to the caller's OpenAI API key, sent as
+`Authorization: Bearer <key>`; requests without one get a 401):
+- POST /analyses                     {"profile_url", "job_preferences", "refresh_profile", "assistant_id", "user"} -> job
+- POST /threads/{thread_id}/follow-ups  {"question", "turn", "job_preferences", "assistant_id", "user"} -> job
+- GET  /jobs/{job_id}                -> job: {"id", "status", "progress", "result", "error", ...}
+- GET  /healthz, GET /metrics        (metrics are per worker process)
+"""
+import argparse
+import math
+import os
+
+# Shared stores must be configured before the pipeline modules are imported (by this process and by
+# every worker process, which inherits the environment)
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+os.environ.setdefault("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite3"))
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from analysis_client import LocalAnalysisClient
+from instrumentation import metrics
+from rate_limit import OverloadedError
+
+# Default assistant when a request doesn't name one
+assistant_id = os.getenv("ASSISTANT_ID")
+
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.getenv('SERVICE_PORT', 8000))
+SERVICE_WORKERS = int(os.getenv('SERVICE_WORKERS', os.cpu_count() or 1))
+
+
+class AnalysisRequest(BaseModel):
+    profile_url: str
+    job_preferences: str = ""
+    refresh_profile: bool = False
+    assistant_id: str | None = None
+    user: str | None = None
+
+
+class FollowUpRequest(BaseModel):
+    question: str
+    turn: int = 0
+    job_preferences: str = ""
+    assistant_id: str | None = None
+    user: str | None = None
+
+
+app = FastAPI(title="ReviewIn analysis service")
+client = LocalAnalysisClient()
+
+
+def _api_key(authorization):
+    # No fallback to the server's own key: anyone who can reach the service could spend it, and keyless
+    # callers would share one key fingerprint and so each other's jobs and threads
+    api_key = (authorization or "").removeprefix("Bearer ").strip()
+    if not api_key:
+        raise HTTPException(status_code=401, detail="An OpenAI API key is required")
+    return api_key
+
+
+def _overloaded(error):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(error)},
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+@app.post("/analyses", status_code=202)
+def start_analysis(request: AnalysisRequest, authorization: str | None = Header(default=None)):
+    try:
+        job = client.start_analysis(_api_key(authorization), request.assistant_id or assistant_id,
+                                    request.profile_url, request.job_preferences, user=request.user,
+                                    refresh_profile=request.refresh_profile)
+    except OverloadedError as e:
+        return _overloaded(e)
+    return job.to_dict()
+
+
+@app.post("/threads/{thread_id}/follow-ups", status_code=202)
+def ask_follow_up(thread_id: str, request: FollowUpRequest, authorization: str | None = Header(default=None)):
+    try:
+        job = client.ask_follow_up(_api_key(authorization), request.assistant_id or assistant_id, thread_id,
+                                   request.turn, request.question, request.job_preferences, user=request.user)
+    except OverloadedError as e:
+        return _overloaded(e)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = client.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job.to_dict()
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return metrics.render_prometheus()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the analysis service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    args = parser.parse_args()
+
+    # Each worker process governs its share of the upstream quotas
+    os.environ.setdefault("GOVERNOR_PROCESSES", str(args.workers))
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import threading
+
+
+class ThreadSync:
+    """
+    Local store of thread messages that fetches only what is new.
+
+    For each thread it remembers the ID of the newest message seen and asks the API only for messages
+    after it, so a growing conversation costs one small request per turn instead of listing (and
+    scanning) the whole thread every time. Keep one instance per session, e.g. in st.session_state.
+    """
+
+    def __init__(self, client, page_size=100):
+        self.client = client
+        self.page_size = page_size
+        self.messages = {}
+        self.last_seen = {}
+        self._lock = threading.Lock()
+
+    def sync(self, thread_id):
+        """Fetch the messages added to a thread since the last sync and return them, oldest first."""
+        with self._lock:
+            new_messages = []
+            after = self.last_seen.get(thread_id)
+            while True:
+                kwargs = {"thread_id": thread_id, "order": "asc", "limit": self.page_size}
+                if after:
+                    kwargs["after"] = after
+                page = self.client.beta.threads.messages.list(**kwargs)
+                new_messages.extend(page.data)
+                if page.data:
+                    after = page.data[-1].id
+                if not page.has_more or not page.data:
+                    break
+
+            self.messages.setdefault(thread_id, []).extend(new_messages)
+            if after:
+                self.last_seen[thread_id] = after
+            return new_messages
+
+    def run_messages(self, thread_id, run_id, role="assistant"):
+        """Return the text of the messages a run added to the thread, oldest first."""
+        self.sync(thread_id)
+        return [
+            message.content[0].text.value
+            for message in self.messages.get(thread_id, [])
+            if message.run_id == run_id and message.role == role
+        ]
+
+    def forget(self, thread_id):
+        with self._lock:
+            self.messages.pop(thread_id, None)
+            self.last_seen.pop(thread_id, None)
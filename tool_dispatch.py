@@ -0,0 +1,116 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from instrumentation import metrics, span
+from jobs import JOB_WORKERS
+from vision import analyze_profile_picture
+
+# Assistant function tools, by function name. Handlers are called as handler(client, arguments, context)
+# and return the tool output string.
+TOOL_HANDLERS = {}
+
+TOOL_TIMEOUT = float(os.getenv('TOOL_TIMEOUT', 60))
+
+# One worker per concurrent job (jobs.py), so a tool call never queues behind other analyses' calls
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TOOL_WORKERS', JOB_WORKERS)), thread_name_prefix="tool-call")
+
+
+def register_tool(name):
+    """Decorator registering a handler for the Assistant function tool `name`."""
+    def decorator(handler):
+        TOOL_HANDLERS[name] = handler
+        return handler
+    return decorator
+
+
+def dispatch_tool_calls(client, run, context=None, timeout=TOOL_TIMEOUT):
+    """
+    Run every pending tool call of a run concurrently and return their outputs, one per call, ready for
+    a single submit_tool_outputs request. Calls that fail, time out or name an unknown tool get an error
+    message as their output so the run can still continue.
+
+    Each call gets `timeout` seconds from when it starts running, not from when it was queued. Handlers are
+    passed the timeout too (context["timeout"]) and should bound their own upstream requests with it, since
+    a call that has already started can't be cancelled.
+    """
+    if run.status != 'requires_action' or run.required_action.type != 'submit_tool_outputs':
+        return []
+    context = context or {}
+    tool_calls = run.required_action.submit_tool_outputs.tool_calls
+
+    # Tool calls run in copies of the caller's context, so their upstream requests count for the same user
+    started = {tool_call.id: _Started() for tool_call in tool_calls}
+    futures = {
+        tool_call.id: _executor.submit(
+            contextvars.copy_context().run, _call_tool, client, tool_call, context, timeout, started[tool_call.id]
+        )
+        for tool_call in tool_calls
+    }
+
+    tool_outputs = []
+    for tool_call in tool_calls:
+        future = futures[tool_call.id]
+        try:
+            output = future.result(timeout=started[tool_call.id].remaining(timeout))
+        except TimeoutError:
+            logging.error(f"Tool call {tool_call.function.name} ({tool_call.id}) timed out after {timeout}s")
+            metrics.incr("tool_call_timeouts_total", tool=tool_call.function.name)
+            output = f"Error: {tool_call.function.name} timed out."
+        tool_outputs.append({'tool_call_id': tool_call.id, 'output': output})
+    return tool_outputs
+
+
+def handle_tool_calls(client, run, context=None, timeout=TOOL_TIMEOUT):
+    """Dispatch the pending tool calls of a run and submit all outputs back to the Assistant in one batch."""
+    tool_outputs = dispatch_tool_calls(client, run, context, timeout)
+    if tool_outputs:
+        return client.beta.threads.runs.submit_tool_outputs(
+            thread_id=run.thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs
+        )
+
+
+class _Started:
+    """When a tool call started running on the pool."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._at = None
+
+    def set(self):
+        self._at = time.monotonic()
+        self._event.set()
+
+    def remaining(self, timeout):
+        """Wait for the call to start, then return how much of `timeout` it has left."""
+        self._event.wait()
+        return max(self._at + timeout - time.monotonic(), 0)
+
+
+def _call_tool(client, tool_call, context, timeout, started):
+    started.set()
+    name = tool_call.function.name
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        logging.error(f"No handler registered for tool {name}")
+        return f"Error: unknown tool {name}."
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+        with span("tool_call", tool=name):
+            return handler(client, arguments, {**context, "timeout": timeout})
+    except Exception as e:
+        logging.exception(f"Tool call {name} ({tool_call.id}) failed")
+        return f"Error: {name} failed ({e})."
+
+
+@register_tool("analyze_profile_picture")
+def _analyze_profile_picture(client, arguments, context):
+    return analyze_profile_picture(
+        client, arguments["image_url"], context.get("job_preferences", ""), timeout=context.get("timeout")
+    )
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import os
+
+from cache import CacheStats, make_cache
+from instrumentation import log_payload, record_usage, register_cache_stats, span
+from profile_picture import VISION_IMAGE_DETAIL, prepare_profile_picture
+
+VISION_MODEL = 'gpt-4-vision-preview'
+
+# Vision answers keyed on the image content and the exact prompt, so a repeated photo costs no tokens
+vision_cache = make_cache(
+    "vision",
+    backend=os.getenv('VISION_CACHE_BACKEND'),
+    path=os.getenv('VISION_CACHE_PATH'),
+    max_entries=int(os.getenv('VISION_CACHE_SIZE', 512)),
+)
+vision_cache_stats = CacheStats()
+register_cache_stats("vision", vision_cache_stats)
+
+VISION_PROMPT = (
+    "Analyze this LinkedIn profile picture. Provide an analysis focusing on its "
+    "appropriateness and effectiveness for a LinkedIn profile. Consider the following aspects:\n\n"
+    "1. Presentation: Evaluate the subject's attire and grooming. Does it align with professional standards suitable for "
+    "their industry or field?\n"
+    "2. Expression and Body Language: Assess the subject's facial expression and body language. Does it project confidence, "
+    "approachability, and professionalism?\n"
+    "3. Composition and Setting: Comment on the composition of the photograph, including the background. Is it distraction-free "
+    "and does it enhance the subject's professional image?\n"
+    "4. Quality and Lighting: Evaluate the quality of the photograph, including lighting and clarity. Does the image quality "
+    "uphold professional standards?\n\n"
+    "Provide recommendations for improvement if necessary, highlighting aspects that could enhance the subject's professional "
+    "portrayal on LinkedIn."
+)
+
+
+def build_vision_prompt(job_preferences=""):
+    additional_context = ""
+    if job_preferences:
+        additional_context += f"\n\n**ADDITIONAL** - If relevant for your analysis, please consider the following context about the user's job preferences: {job_preferences}"
+    return VISION_PROMPT + additional_context
+
+
+def vision_cache_key(image_digest, prompt, model=VISION_MODEL, detail=VISION_IMAGE_DETAIL):
+    digest = hashlib.sha256()
+    for part in (model.encode(), detail.encode(), prompt.encode(), image_digest.encode()):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def analyze_profile_picture(client, image_url, job_preferences="", timeout=None):
+    """
+    Ask GPT-4 Vision for feedback on a profile picture and return the text of its answer.
+    The picture is sent downscaled as a base64 data URL (see profile_picture.py). Answers are cached on a
+    hash of the processed image and the prompt (which includes the job preferences). If the image can't
+    be downloaded the model gets the URL itself and the call goes through uncached. `timeout` (seconds)
+    overrides the client's request timeout.
+    """
+    prompt = build_vision_prompt(job_preferences)
+    picture = prepare_profile_picture(image_url)
+    cache_key = vision_cache_key(picture.digest, prompt, detail=picture.detail) if picture else None
+    if cache_key:
+        entry = vision_cache.get(cache_key)
+        if entry is not None:
+            vision_cache_stats.incr("hits")
+            logging.info(f"Vision cache hit for image at URL: {image_url}")
+            return entry.value
+        vision_cache_stats.incr("misses")
+
+    logging.info(f"Analyzing image at URL: {image_url}")
+    # An explicit timeout=None would disable the client's timeout, so only pass one that is set
+    request_options = {"timeout": timeout} if timeout is not None else {}
+
+    # Call GPT-4 Vision API to analyze the image
+    with span("vision_call"):
+        vision_response = client.chat.completions.create(
+            model=VISION_MODEL,
+            messages=[
+                {
+                "role": "user",
+                "content": [
+                    {
+                    "type": "text",
+                    "text": prompt
+                    },
+                    {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": picture.data_url if picture else image_url,
+                        "detail": picture.detail if picture else VISION_IMAGE_DETAIL,
+                    },
+                    },
+                ],
+                }
+            ],
+            max_tokens=400,
+            **request_options,
+        )
+    vision_content = vision_response.choices[0].message.content
+    record_usage("vision", vision_response.usage)
+    log_payload("Vision response", vision_content)
+    if cache_key and vision_content:
+        vision_cache.set(cache_key, vision_content)
+    return vision_content